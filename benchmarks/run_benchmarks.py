@@ -0,0 +1,218 @@
+"""
+Benchmarks the main stages of the scripts in ``src`` on seeded synthetic data
+at several scales, and reports their run time, throughput and peak memory.
+
+Run from the repository root:
+
+    python benchmarks/run_benchmarks.py --scales small medium --output bench.json
+
+Times are the best of ``--repeat`` runs; peak memory is measured with
+``tracemalloc`` in a separate run, so tracing doesn't distort the times.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_PATH)
+
+import synthetic_data
+import test_independence
+from atlas_contents import ZipContents
+from better_find_issues_in_text import find_issues_in, load_issues
+from contingency_tests import FisherEngine
+from findings_io import write_json_items
+from restructure_found_issues import restructure
+from tag_matrix import write_tag_matrix
+from the_best_parse_atlas_to_csv import generate_data, load_atlas_index
+from thread_issue_referencer import INTERESTING_TAGS, handle, tag_maps
+
+# messages in the text export, issue keys, atlas documents, tag csv rows and columns.
+SCALES = {
+    "small": {
+        "messages": 1000,
+        "issues": 500,
+        "documents": 20,
+        "rows": 500,
+        "tags": 15,
+    },
+    "medium": {
+        "messages": 5000,
+        "issues": 2000,
+        "documents": 100,
+        "rows": 2000,
+        "tags": 20,
+    },
+    "large": {
+        "messages": 20000,
+        "issues": 5000,
+        "documents": 400,
+        "rows": 5000,
+        "tags": 30,
+    },
+}
+SEED = 42
+
+
+def measure(function, setup=None, repeat: int = 3) -> dict:
+    """
+    Runs ``function(*setup())`` and returns the best wall time in seconds and
+    the peak traced memory in bytes. The setup is not measured.
+    """
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup is not None else ()
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    args = setup() if setup is not None else ()
+    tracemalloc.start()
+    try:
+        function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "peak_bytes": peak}
+
+
+def benchmark_scale(scale: str, work_dir: str, repeat: int) -> list:
+    """Generates the inputs of one scale and measures every stage on them."""
+    size = SCALES[scale]
+    issue_path = os.path.join(work_dir, "issues.xlsx")
+    export_path = os.path.join(work_dir, "export.txt")
+    findings_path = os.path.join(work_dir, "findings.json")
+    restructured_path = os.path.join(work_dir, "restructured.json")
+    atlas_path = os.path.join(work_dir, "project.atlproj")
+    tag_path = os.path.join(work_dir, "tags.csv")
+    matrix_path = os.path.join(work_dir, "tags.npy")
+
+    keys = synthetic_data.issue_keys(size["issues"], SEED)
+    synthetic_data.write_issue_xlsx(issue_path, keys)
+    synthetic_data.write_text_export(export_path, size["messages"], keys, SEED)
+    synthetic_data.write_atlas_project(atlas_path, size["documents"], SEED)
+    synthetic_data.write_tag_csv(tag_path, size["rows"], size["tags"], SEED)
+
+    issues = load_issues(issue_path)
+    table, reference_count = find_issues_in(issues, export_path)
+    with open(findings_path, "w", encoding="utf-8") as findings_file:
+        write_json_items(findings_file, table.iter_issue_groups())
+    findings = table.to_issue_view()
+    contents = ZipContents(atlas_path)
+    atlas_index = load_atlas_index(contents)
+    tag_columns = range(3, 3 + size["tags"])
+    header, matrix, _ = test_independence.load_columns(tag_path, tag_columns, [])
+    write_tag_matrix(
+        matrix_path,
+        matrix,
+        header[3 : 3 + size["tags"]],
+        ["email_id"],
+        [(row,) for row in range(size["rows"])],
+        3,
+    )
+
+    def fresh_fisher(data_path: str = tag_path):
+        test_independence.FISHER = FisherEngine()
+        return (data_path, tag_columns, tag_columns)
+
+    stages = [
+        (
+            "find_issues_in",
+            "messages",
+            size["messages"],
+            lambda: find_issues_in(issues, export_path),
+            None,
+        ),
+        (
+            "restructure",
+            "references",
+            reference_count,
+            restructure,
+            lambda: (findings_path, restructured_path),
+        ),
+        (
+            "handle",
+            "references",
+            reference_count,
+            lambda: handle(findings, INTERESTING_TAGS, tag_maps),
+            None,
+        ),
+        (
+            "generate_data",
+            "documents",
+            size["documents"],
+            lambda: generate_data(
+                atlas_index["contents"], atlas_index["quotes"], contents
+            ),
+            None,
+        ),
+        (
+            "calculate",
+            "pairs",
+            size["tags"] ** 2,
+            test_independence.calculate,
+            fresh_fisher,
+        ),
+        (
+            "calculate_npy",
+            "pairs",
+            size["tags"] ** 2,
+            test_independence.calculate,
+            lambda: fresh_fisher(matrix_path),
+        ),
+    ]
+    results = []
+    try:
+        for stage, unit, items, function, setup in stages:
+            result = measure(function, setup, repeat)
+            seconds = result["seconds"]
+            result.update(
+                {
+                    "stage": stage,
+                    "scale": scale,
+                    "unit": unit,
+                    "items": items,
+                    "throughput": items / seconds if seconds > 0 else None,
+                }
+            )
+            results.append(result)
+            print(format_result(result), flush=True)
+    finally:
+        contents.close()
+    return results
+
+
+def format_result(result: dict) -> str:
+    """Formats a measurement as a report line."""
+    throughput = result["throughput"]
+    rate = f"{throughput:>12.1f}" if throughput is not None else f"{'-':>12}"
+    return (
+        f'{result["stage"]:<16}{result["scale"]:<8}{result["items"]:>10} '
+        f'{result["unit"]:<11}{result["seconds"]:>10.4f}s {rate}/s '
+        f'{result["peak_bytes"] / 2**20:>10.2f} MiB'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scales", nargs="+", choices=list(SCALES), default=["small"]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="path of a json file to write the results to")
+    arguments = parser.parse_args()
+    results = []
+    for scale in arguments.scales:
+        with tempfile.TemporaryDirectory() as work_dir:
+            results.extend(benchmark_scale(scale, work_dir, arguments.repeat))
+    if arguments.output is not None:
+        with open(arguments.output, "w", encoding="utf-8") as output_file:
+            output_file.write(json.dumps({"seed": SEED, "results": results}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+Seeded generators of synthetic inputs for the benchmarks: data browser text
+exports, issue xlsx files, web atlas projects and 0/1 tag csv files.
+The same seed always produces the same files.
+"""
+
+import random
+from xml.sax.saxutils import escape, quoteattr
+from zipfile import ZIP_DEFLATED, ZipFile
+
+from openpyxl import Workbook
+
+PROJECTS = ["HADOOP", "HDFS", "YARN", "MAPREDUCE", "CASSANDRA", "TAJO"]
+MESSAGE_TAGS = [
+    "Release Group",
+    "Feature Group",
+    "Quality Group",
+    "Issue Impact",
+    "Resource",
+    "Other",
+    "Architecturally Irrelevant",
+]
+DECISION_TYPES = [
+    "existence-behavioral",
+    "existence-structural",
+    "process",
+    "property",
+    "technology",
+]
+RATIONALE_TYPES = [
+    "Assumption",
+    "Constraints",
+    "Decision Rule",
+    "Quality Issue",
+    "Solution Benefits and Drawbacks",
+    "Solution Evaluation",
+    "Solution Risks",
+    "Solution Trade-off",
+    "Solution Comparison",
+    "Other",
+]
+WORDS = (
+    "the we should use a cache because latency matters and it is simple "
+    "to patch fixes bug in reply see also about this change"
+).split()
+
+
+def issue_keys(count: int, seed: int = 0) -> list:
+    """Generates unique issue keys of the studied projects."""
+    rng = random.Random(seed)
+    keys = set()
+    while len(keys) < count:
+        keys.add(f"{rng.choice(PROJECTS)}-{rng.randint(1, 20000)}")
+    return sorted(keys)
+
+
+def issue_variants(key: str) -> list:
+    """The ways an issue key is referenced in emails (``MR-123``, ``M123``, ...)."""
+    project, number = key.split("-")
+    if project == "HDFS":
+        return [key]
+    prefix = project[0] if project[0] != "M" else "MR"
+    return [key, f"{prefix}{number}", f"{prefix}-{number}"]
+
+
+def write_issue_xlsx(path: str, keys: list):
+    """Writes the issue keys in the layout of the architectural issue sheet."""
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["issues key", "summary"])
+    for key in keys:
+        sheet.append([key, "synthetic issue"])
+    workbook.save(path)
+
+
+def write_text_export(
+    path: str, messages: int, keys: list, seed: int = 0, reference_rate: float = 0.3
+) -> int:
+    """
+    Writes a data browser text export of ``Message id:`` blocks with meta data,
+    tags and body lines that reference the issue keys. Returns the line count.
+    """
+    rng = random.Random(seed)
+    line_count = 0
+    with open(path, "w", encoding="utf-8") as export_file:
+        for message in range(messages):
+            subject = f"{'Re: ' if rng.random() < 0.5 else ''}Thread {message % 500}"
+            lines = [
+                f"Message id: {message}",
+                f"Email id: <{message}.{seed}@example.org>",
+                f"Subject: {subject}",
+                f"Date: 2015-{1 + message % 12:02d}-{1 + message % 28:02d} 10:00:00",
+                "Sent from: dev@example.org",
+            ]
+            if rng.random() < 0.9:
+                tags = rng.sample(MESSAGE_TAGS, rng.randint(1, 3))
+                lines.append(f"Tags: {', '.join(tags)}")
+            for _ in range(rng.randint(2, 15)):
+                words = rng.choices(WORDS, k=rng.randint(4, 14))
+                if rng.random() < reference_rate:
+                    reference = rng.choice(issue_variants(rng.choice(keys)))
+                    words.insert(rng.randint(0, len(words)), f"{reference}.")
+                quote = "> " if rng.random() < 0.3 else ""
+                lines.append(quote + " ".join(words))
+            lines.append("")
+            export_file.write("\n".join(lines) + "\n")
+            line_count += len(lines)
+    return line_count
+
+
+def write_atlas_project(path: str, documents: int, seed: int = 0) -> dict:
+    """
+    Writes a web atlas project with email threads as documents, quotations
+    with tag links, and shared comments. Returns the number of documents,
+    quotations and comments.
+    """
+    rng = random.Random(seed)
+    tags = [(f"tag_{index}", name) for index, name in enumerate(RATIONALE_TYPES)]
+    members = {}
+    contents = []
+    links = []
+    document_elements = []
+    comment_ids = []
+    quote_count = 0
+    for comment in range(max(1, documents // 3)):
+        loc = f"c{comment:05d}"
+        spans = "".join(
+            f'<span>{escape(" ".join(rng.choices(WORDS, k=6)))}</span>'
+            f'<br id="{rng.randint(0, 9)}">'
+            for _ in range(rng.randint(1, 4))
+        )
+        members[f"contents/{loc}/content"] = (
+            f"<html><head></head><body><p>{spans}<span>end</span></p></body></html>"
+        )
+        contents.append((f"cnt_c{comment}", loc))
+        comment_ids.append(f"cnt_c{comment}")
+    for document in range(documents):
+        loc = f"d{document:05d}"
+        contents.append((f"cnt_{document}", loc))
+        elements = []
+        segments = []
+        for email in range(rng.randint(1, 8)):
+            elements.append(f"<h2><span>Email {email}</span></h2>")
+            header = [
+                ("Email id:", f"<{document}.{email}@example.org>"),
+                ("Subject:", f"Re: design of component {document}"),
+                ("Tags:", ", ".join(rng.sample(DECISION_TYPES, rng.randint(1, 2)))),
+            ]
+            for label, value in header:
+                elements.append(f"<p><span>{escape(label)}</span></p>")
+                elements.append(f"<p><span>{escape(value)}</span></p>")
+            for _ in range(rng.randint(2, 10)):
+                text = " ".join(rng.choices(WORDS, k=rng.randint(5, 30)))
+                elements.append(f"<p><span>{escape(text)}&nbsp;</span></p>")
+                segments.append((len(elements), len(text)))
+        body = "".join(
+            element.replace(">", f' id="{index}">', 1)
+            for index, element in enumerate(elements)
+        )
+        members[f"contents/{loc}/content"] = (
+            '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Strict//EN" '
+            '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-strict.dtd">'
+            f"<html><head></head><body>{body}</body></html>"
+        )
+        quotations = []
+        for segment, length in rng.sample(segments, rng.randint(0, len(segments))):
+            quote_id = f"quot_{quote_count}"
+            quote_count += 1
+            start = rng.randint(0, length // 2)
+            comment = ""
+            if rng.random() < 0.3:
+                comment = f'<comment content="{rng.choice(comment_ids)}"/>'
+            quotations.append(
+                f'<quotation id="{quote_id}">{comment}<location><segmentedTextLoc '
+                f'sSegment="{segment}" sOffset="{start}" eSegment="{segment}" '
+                f'eOffset="{rng.randint(start, length)}"/></location></quotation>'
+            )
+            for tag_id, _ in rng.sample(tags, rng.randint(1, 3)):
+                links.append((tag_id, quote_id))
+        document_elements.append(
+            f'<document id="doc_{document}" name="thread {document}">'
+            f'<layer>{"".join(quotations)}</layer></document>'
+        )
+    project = "".join(
+        [
+            "<project><tags>",
+            "".join(f"<tag id={quoteattr(i)} name={quoteattr(n)}/>" for i, n in tags),
+            "</tags><links>",
+            "".join(f'<tagQuotLink source="{s}" target="{t}"/>' for s, t in links),
+            "</links><documents>",
+            "".join(document_elements),
+            "</documents><contents>",
+            "".join(f'<content id="{i}" loc="{loc}"/>' for i, loc in contents),
+            "</contents></project>",
+        ]
+    )
+    with ZipFile(path, "w", ZIP_DEFLATED) as atlas_zip:
+        atlas_zip.writestr("project.aprx", project)
+        for member, data in members.items():
+            atlas_zip.writestr(member, data)
+    return {
+        "documents": documents,
+        "quotations": quote_count,
+        "comments": len(comment_ids),
+    }
+
+
+def write_tag_csv(
+    path: str, rows: int, columns: int, seed: int = 0, density: float = 0.2
+):
+    """
+    Writes a csv like ``export_emails.csv``: three meta data columns followed
+    by 0/1 tag columns.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as csv_file:
+        header = ["document", "email_id", "email_subject"]
+        header += [f'"tag {column}"' for column in range(columns)]
+        csv_file.write(",".join(header) + ",\n")
+        for row in range(rows):
+            values = ["1" if rng.random() < density else "0" for _ in range(columns)]
+            csv_file.write(f'doc_{row // 10},{row},"subject {row}",')
+            csv_file.write(",".join(values) + ",\n")
@@ -0,0 +1,106 @@
+"""
+Access to the members of a web atlas project (``project.aprx`` and the
+``contents/<loc>/content`` files), either straight from the zipped project
+or from a directory it was extracted to.
+"""
+
+import os
+from hashlib import blake2b
+from zipfile import ZipFile
+
+from stage_metrics import timed
+
+PROJECT_MEMBER = "project.aprx"
+
+
+def content_member(loc: str) -> str:
+    """Path of a content file inside the project."""
+    return f"contents/{loc}/content"
+
+
+def document_content_id(doc_id: str) -> str:
+    """Id of the content holding the text of a document (``doc_N`` -> ``cnt_N``)."""
+    return f"cnt_{doc_id[4:]}"
+
+
+class ZipContents:
+    """
+    Reads project members lazily from the zip archive, without extracting it.
+    Only the archive path is pickled, so it can be handed to worker processes.
+    """
+
+    def __init__(self, atlas_project_path: str):
+        self.atlas_project_path = atlas_project_path
+        self._archive = None
+
+    def __getstate__(self) -> dict:
+        return {"atlas_project_path": self.atlas_project_path, "_archive": None}
+
+    def _zip(self) -> ZipFile:
+        if self._archive is None:
+            self._archive = ZipFile(self.atlas_project_path, "r")
+        return self._archive
+
+    def open_project(self):
+        """Opens ``project.aprx`` as a binary stream."""
+        return self._zip().open(PROJECT_MEMBER)
+
+    def open_content(self, loc: str):
+        """Opens a content file as a binary stream."""
+        return self._zip().open(content_member(loc))
+
+    def read_content(self, loc: str) -> bytes:
+        """Reads a content file."""
+        return self._zip().read(content_member(loc))
+
+    def signature(self, loc: str) -> str:
+        """Identifies the data of a content file by the CRC and size in the archive."""
+        info = self._zip().getinfo(content_member(loc))
+        return f"{info.CRC:08x}:{info.file_size}"
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+class DirectoryContents:
+    """Reads project members from an extracted project; meant for debugging."""
+
+    def __init__(self, atlas_output_path: str):
+        self.atlas_output_path = atlas_output_path
+
+    def open_project(self):
+        """Opens ``project.aprx`` as a binary stream."""
+        return open(os.path.join(self.atlas_output_path, PROJECT_MEMBER), "rb")
+
+    def open_content(self, loc: str):
+        """Opens a content file as a binary stream."""
+        return open(os.path.join(self.atlas_output_path, content_member(loc)), "rb")
+
+    def read_content(self, loc: str) -> bytes:
+        """Reads a content file."""
+        with self.open_content(loc) as content_file:
+            return content_file.read()
+
+    def signature(self, loc: str) -> str:
+        """Identifies the data of a content file by its hash."""
+        return blake2b(self.read_content(loc), digest_size=16).hexdigest()
+
+    def close(self):
+        pass
+
+
+@timed()
+def open_atlas_contents(
+    atlas_project_path: str, atlas_output_path: str = None, extract: bool = False
+):
+    """
+    Returns the contents accessor of a project. By default members are read
+    from the zip; with ``extract`` the project is unpacked to the output path first.
+    """
+    if not extract:
+        return ZipContents(atlas_project_path)
+    with ZipFile(atlas_project_path, "r") as atlas_zip:
+        atlas_zip.extractall(atlas_output_path)
+    return DirectoryContents(atlas_output_path)
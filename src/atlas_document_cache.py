@@ -0,0 +1,79 @@
+"""
+Persistent cache of the email and quote entries generated per atlas document,
+so reruns of ``the_best_parse_atlas_to_csv.py`` only regenerate the documents
+that changed. A document is keyed by a hash of its content member, its
+quotations with their tags and the comments they refer to.
+"""
+
+import json
+import os
+from hashlib import blake2b
+
+from atlas_contents import document_content_id
+
+# bump when the generated entries change, to invalidate older caches.
+CACHE_VERSION = 2
+
+
+def document_key(doc_id: str, quotes: list, cnt_to_doc: dict, contents) -> str:
+    """Hashes everything the entries of a document are generated from."""
+    comment_ids = sorted(
+        {
+            quote["comment_content_id"]
+            for quote in quotes
+            if quote["comment_content_id"] is not None
+        }
+    )
+    key = [
+        CACHE_VERSION,
+        doc_id,
+        contents.signature(cnt_to_doc[document_content_id(doc_id)]),
+        quotes,
+        [
+            [comment_id, contents.signature(cnt_to_doc[comment_id])]
+            for comment_id in comment_ids
+        ],
+    ]
+    return blake2b(json.dumps(key).encode("utf-8"), digest_size=16).hexdigest()
+
+
+class DocumentCache:
+    """Generated entries per document, stored as ``[key, emails, quotes]``."""
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self.documents = {}
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as cache_file:
+                self.documents = json.loads(cache_file.read())["documents"]
+
+    def get(self, doc_id: str, key: str):
+        """Returns the ``(emails, quotes)`` of a document, or None when outdated."""
+        cached = self.documents.get(doc_id)
+        if cached is None or cached[0] != key:
+            return None
+        emails = [
+            {**email, "rationale_tags": set(email["rationale_tags"])}
+            for email in cached[1]
+        ]
+        return emails, cached[2]
+
+    def put(self, doc_id: str, key: str, emails: list, quotes: list):
+        """Stores the entries generated for a document."""
+        emails = [
+            {**email, "rationale_tags": sorted(email["rationale_tags"])}
+            for email in emails
+        ]
+        self.documents[doc_id] = [key, emails, quotes]
+
+    def save(self, doc_ids):
+        """Writes the entries of the given documents to disk, dropping the others."""
+        self.documents = {
+            doc_id: self.documents[doc_id]
+            for doc_id in doc_ids
+            if doc_id in self.documents
+        }
+        temp_path = f"{self.cache_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as cache_file:
+            cache_file.write(json.dumps({"documents": self.documents}))
+        os.replace(temp_path, self.cache_path)
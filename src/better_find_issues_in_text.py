@@ -1,127 +1,451 @@
 """finds issues in text file, but better."""
 
-import json
-import re
-from copy import deepcopy
-import pandas as pd
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+from data_browser_export import iter_lines, iter_message_blocks, message_shards
+from findings_io import write_finding, write_json_items
+from findings_store import build_store
+from findings_table import FindingsTable, build_entry
+from issue_matcher import IssueMatcher
+from issue_vocabulary import load_vocabulary
+from message_index import FIRST_LINE, START, END, MessageIndex, load_message_index
+from scan_state import ScanState, hash_lines
+from stage_metrics import timed
 
+
+@timed(items=lambda issues, *_: len(issues))
 def load_issues(issue_file_path: str) -> list:
     """Loads issues from file"""
-    dataframe = pd.read_excel(issue_file_path)
-    issues = []
-    for (_, row) in dataframe.iterrows():
-        issue = row["issues key"].strip()
-        issues.append(issue)
-        spl = issue.split("-")
-        if spl[0] != "HDFS":
-            prefix = issue[0] if issue[0] != "M" else "MR"
-            issues.append(f'{prefix}{issue.split("-")[1]}')
-            issues.append(f'{prefix}-{issue.split("-")[1]}')
-    return issues
-
-
-def find_issues_in(iss: list, file_path: str) -> dict:
-    """Finds issues in text"""
-    results = {}
-    found = 0
-    with open(file_path, "r", encoding="utf-8") as data_file:
-        current_message = {}
-        for index, line in enumerate(data_file):
+    return load_vocabulary(issue_file_path)["variants"]
+
+
+class ReferenceScanner:
+    """
+    Walks the lines of a data browser export and yields the issue references.
+    Keeps the meta data of the current message and the number of lines seen.
+    """
+
+    def __init__(self, matcher: IssueMatcher):
+        self.matcher = matcher
+        self.current_message = {}
+        self.line_count = 0
+
+    def scan(self, lines, match=None):
+        """
+        Yields ``(issue, message, line_index, line, offset)`` for every reference,
+        as soon as it is found. The message dict is shared by all references
+        until the meta data changes, then a new dict takes its place.
+        ``match(line_index, line)`` can replace the matcher for these lines.
+        """
+        if match is None:
+            match = self._match
+        for index, line in enumerate(lines, self.line_count):
+            self.line_count += 1
             the_line = line.strip()
-            if "id" in current_message and current_message["id"] == "41659":
-                print(current_message)
             # set the meta data
             if the_line.startswith("Message id: "):
-                current_message["id"] = the_line[len("Message id: ") :].strip()
+                self._set("id", the_line[len("Message id: ") :].strip())
             elif the_line.startswith("Subject: "):
-                current_message["subject"] = the_line[len("Subject: ") :].strip()
+                self._set("subject", the_line[len("Subject: ") :].strip())
             elif the_line.startswith("Date: "):
-                current_message["date"] = the_line[len("Date: ") :].strip()
+                self._set("date", the_line[len("Date: ") :].strip())
             elif the_line.startswith("Sent from: "):
-                current_message["sent_from"] = the_line[len("Sent from: ") :].strip()
+                self._set("sent_from", the_line[len("Sent from: ") :].strip())
             elif the_line.startswith("Email id: "):
-                current_message["email_id"] = the_line[len("Email id: ") :].strip()
+                self._set("email_id", the_line[len("Email id: ") :].strip())
             elif the_line.startswith("Tags:"):
-                current_message["tags"] = [
-                    tag.strip() for tag in the_line[len("Tags:") :].split(",")
-                ]
+                self._set(
+                    "tags",
+                    [tag.strip() for tag in the_line[len("Tags:") :].split(",")],
+                )
             else:
                 # search the line for occurrences.
-                for issue in iss:
-                    # simple check for find.
+                for issue in match(index, the_line):
                     offset = the_line.find(issue)
-                    if offset == -1:
-                        continue
-                    # double check for spurious finds to be sure.
-                    pattern = rf"{issue}[^0-9]"
-                    re_finds = re.findall(pattern, the_line)
-                    if len(re_finds) == 0:
-                        continue
-                    # add the find
-                    if not issue in results:
-                        results[issue] = []
-                    new_entry = deepcopy(current_message)
-                    new_entry["line_index"] = index
-                    new_entry["line"] = the_line
-                    new_entry["offset"] = offset
-                    new_entry["re_finds"] = re_finds
-                    results[issue].append(new_entry)
-                    found += 1
-    return results, found
-
-
-def find(issue_file_path: str, input_paths: list, output_path: str):
-    """Finds all issue references in the provided text files."""
+                    yield issue, self.current_message, index, the_line, offset
+
+    def _match(self, _: int, line: str) -> list:
+        return self.matcher.match(line)
+
+    def _set(self, field: str, value):
+        """Sets a meta data field on a fresh copy of the current message."""
+        self.current_message = {**self.current_message, field: value}
+
+
+@timed(items=lambda found, *_: len(found[0]))
+def scan_lines(matcher: IssueMatcher, lines) -> tuple:
+    """
+    Finds issues in the lines.
+    Also returns the number of lines and the meta data of the last message.
+    """
+    table = FindingsTable()
+    scanner = ReferenceScanner(matcher)
+    for issue, message, line_index, line, offset in scanner.scan(lines):
+        table.add(issue, message, line_index, line, offset)
+    return table, scanner.line_count, scanner.current_message
+
+
+@timed(items=lambda found, *_: found[1])
+def find_issues_in(iss: list, file_path: str) -> tuple:
+    """Finds issues in text; returns the findings table and the reference count."""
+    with open(file_path, "r", encoding="utf-8") as data_file:
+        table, _, _ = scan_lines(IssueMatcher(iss), data_file)
+    return table, len(table)
+
+
+def _stored_matches(stored: list, start: int, keep: set = None) -> dict:
+    """Groups stored ``[relative line, issue]`` references per line index."""
+    per_line = {}
+    for relative_line, issue in stored:
+        if keep is None or issue in keep:
+            per_line.setdefault(start + relative_line, []).append(issue)
+    return per_line
+
+
+def _planned_messages(file_path: str, state: ScanState):
+    """Yields ``(key, lines, hash, stored state)`` for every message of the file."""
+    occurrences = {}
+    for message_id, block in iter_message_blocks(iter_lines(file_path)):
+        # message ids can repeat, the n-th occurrence is its own message.
+        occurrences[message_id] = occurrences.get(message_id, 0) + 1
+        key = f"{message_id}#{occurrences[message_id]}"
+        message_hash = hash_lines(block)
+        yield key, block, message_hash, state.lookup(file_path, key)
+
+
+def _needs_scan(message_hash: str, previous) -> bool:
+    return previous is None or previous[0] != message_hash
+
+
+def _match_blocks(blocks: list) -> list:
+    """Matches every line of the message blocks in a worker."""
+    return [[_WORKER_MATCHER.match(line.strip()) for line in block] for block in blocks]
+
+
+def _with_line_matches(planned, pool, workers: int):
+    """
+    Adds the matches of every line to the messages that have to be scanned,
+    matched in batches in the process pool, in message order; other messages
+    get None. Only a few batches are in flight, so the file is never held.
+    """
+    pending = deque()
+
+    def submit(batch: list):
+        blocks = [
+            block
+            for _, block, message_hash, previous in batch
+            if _needs_scan(message_hash, previous)
+        ]
+        pending.append((batch, pool.submit(_match_blocks, blocks)))
+
+    def drain():
+        batch, future = pending.popleft()
+        line_matches = iter(future.result())
+        for key, block, message_hash, previous in batch:
+            matches = None
+            if _needs_scan(message_hash, previous):
+                matches = next(line_matches)
+            yield key, block, message_hash, previous, matches
+
+    batch = []
+    for message in planned:
+        batch.append(message)
+        if len(batch) >= INCREMENTAL_BATCH_SIZE:
+            submit(batch)
+            batch = []
+            if len(pending) > workers * SHARDS_PER_WORKER:
+                yield from drain()
+    if len(batch) > 0:
+        submit(batch)
+    while len(pending) > 0:
+        yield from drain()
+
+
+def find_issues_incremental(
+    matcher: IssueMatcher, file_path: str, state: ScanState, pool=None, workers=1
+):
+    """
+    Finds issues in text, reusing the references stored in the scan state.
+    New and changed messages are scanned completely, in the process pool when
+    one is given, unchanged messages are only scanned for issues that were
+    added to the vocabulary since.
+    Returns the findings table, the reference count and the rescanned message count.
+    """
+    table = FindingsTable()
+    scanner = ReferenceScanner(matcher)
+    vocabulary = set(matcher.issues)
+    added_matchers = {}
+    rescanned = 0
+    planned = _planned_messages(file_path, state)
+    if pool is not None:
+        planned = _with_line_matches(planned, pool, workers)
+    else:
+        planned = (message + (None,) for message in planned)
+    for key, block, message_hash, previous, line_matches in planned:
+        start = scanner.line_count
+        if _needs_scan(message_hash, previous):
+            match = None
+            if line_matches is not None:
+                match = lambda index, _, matches=line_matches, start=start: matches[
+                    index - start
+                ]
+            rescanned += 1
+        elif previous[1] == state.version:
+            stored = _stored_matches(previous[2], start)
+            match = lambda index, _, stored=stored: stored.get(index, [])
+        else:
+            old_version = previous[1]
+            if old_version not in added_matchers:
+                old_vocabulary = set(state.vocabularies[old_version])
+                added_matchers[old_version] = IssueMatcher(
+                    [issue for issue in matcher.issues if issue not in old_vocabulary]
+                )
+            added_matcher = added_matchers[old_version]
+            stored = _stored_matches(previous[2], start, vocabulary)
+            match = lambda index, line, stored=stored, added=added_matcher: (
+                matcher.in_vocabulary_order(stored.get(index, []) + added.match(line))
+            )
+        hits = []
+        for issue, message, line_index, line, offset in scanner.scan(block, match):
+            table.add(issue, message, line_index, line, offset)
+            hits.append([line_index - start, issue])
+        state.record(file_path, key, message_hash, hits)
+    state.finish_file(file_path)
+    return table, len(table), rescanned
+
+
+def find_issues_in_window(
+    matcher: IssueMatcher, file_path: str, index: MessageIndex, start=None, end=None
+) -> tuple:
+    """
+    Finds issues only in the messages dated within the window,
+    reading each of them with one seek through the message index.
+    Every message is scanned with only its own meta data.
+    """
+    table = FindingsTable()
+    for row in sorted(index.rows_between(start, end), key=lambda row: row[START]):
+        scanner = ReferenceScanner(matcher)
+        scanner.line_count = row[FIRST_LINE]
+        lines = iter_lines(file_path, row[START], row[END])
+        for issue, message, line_index, line, offset in scanner.scan(lines):
+            table.add(issue, message, line_index, line, offset)
+    return table, len(table)
+
+
+SHARDS_PER_WORKER = 4
+# messages per batch that incremental scans hand to a worker.
+INCREMENTAL_BATCH_SIZE = 500
+
+_WORKER_MATCHER = None
+
+
+def _init_worker(iss: list):
+    """Compiles the issue matcher once per worker process."""
+    global _WORKER_MATCHER
+    _WORKER_MATCHER = IssueMatcher(iss)
+
+
+def _scan_shard(file_path: str, start: int, end: int) -> tuple:
+    """Finds issues in one byte range of a file."""
+    return scan_lines(_WORKER_MATCHER, iter_lines(file_path, start, end))
+
+
+def merge_shards(shard_results) -> tuple:
+    """
+    Merges the shard results of one file, in file order,
+    into the results a sequential scan of the file would give.
+    """
+    table = FindingsTable()
+    line_offset = 0
+    # meta data that a sequential scan carries over into the next shard.
+    carried = {}
+    for shard_table, line_count, last_message in shard_results:
+        table.extend(shard_table, line_offset, carried)
+        line_offset += line_count
+        carried.update(last_message)
+    return table, len(table)
+
+
+def find_issues_parallel(iss: list, file_paths: list, workers: int) -> list:
+    """
+    Finds issues in all files at once by scanning message-aligned shards
+    in a process pool. Returns ``(results, found)`` per file, in file order.
+    """
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(iss,)
+    ) as pool:
+        file_futures = [
+            [
+                pool.submit(_scan_shard, file_path, start, end)
+                for start, end in message_shards(
+                    file_path, workers * SHARDS_PER_WORKER
+                )
+            ]
+            for file_path in file_paths
+        ]
+        return [
+            merge_shards(future.result() for future in futures)
+            for futures in file_futures
+        ]
+
+
+def find_all(
+    issue_file_path: str,
+    input_paths: list,
+    workers: int = 1,
+    state_path: str = None,
+    date_window: tuple = None,
+) -> FindingsTable:
+    """
+    Finds all issue references in the provided text files and returns them.
+    With more than one worker, the files are scanned in parallel shards.
+    With a state path, only messages and issues that changed since the
+    previous run are scanned, and interrupted runs resume from the last checkpoint;
+    with more than one worker, those messages are scanned in parallel.
+    With a ``(start, end)`` date window, only messages dated within it are
+    scanned, using a message index stored next to every input file. It can't
+    be combined with a state path or more than one worker.
+    """
+    if date_window is not None and (state_path is not None or workers > 1):
+        raise ValueError(
+            "A date window can't be combined with a state path or several workers."
+        )
     print("new start")
     issues = load_issues(issue_file_path)
-    all_findings = {}
-    for in_path in input_paths:
-        print(f"Starting {in_path}")
-        findings, count = find_issues_in(issues, in_path)
-        print(f"Finished. reference count: {count}")
-        if all_findings is None:
-            # sets initial value.
-            all_findings = findings
+    matcher = IssueMatcher(issues)
+    if state_path is not None:
+        state = ScanState(state_path, issues)
+        pool = None
+        if workers > 1:
+            pool = ProcessPoolExecutor(
+                workers, initializer=_init_worker, initargs=(issues,)
+            )
+        file_findings = []
+        try:
+            for in_path in input_paths:
+                print(f"Starting {in_path}")
+                table, count, rescanned = find_issues_incremental(
+                    matcher, in_path, state, pool, workers
+                )
+                print(f"Rescanned {rescanned} message(s) in {in_path}")
+                file_findings.append((table, count))
+        finally:
+            state.checkpoint()
+            if pool is not None:
+                pool.shutdown()
+        state.save()
+    elif date_window is not None:
+        file_findings = []
+        for in_path in input_paths:
+            print(f"Starting {in_path} between {date_window[0]} and {date_window[1]}")
+            index = load_message_index(in_path, f"{in_path}.index.json")
+            file_findings.append(
+                find_issues_in_window(matcher, in_path, index, *date_window)
+            )
+    elif workers > 1:
+        print(f"Starting {len(input_paths)} file(s) with {workers} workers")
+        file_findings = find_issues_parallel(issues, input_paths, workers)
+    else:
+        file_findings = None
+    all_findings = FindingsTable()
+    for file_index, in_path in enumerate(input_paths):
+        if file_findings is None:
+            print(f"Starting {in_path}")
+            with open(in_path, "r", encoding="utf-8") as data_file:
+                findings, _, _ = scan_lines(matcher, data_file)
+            count = len(findings)
         else:
-            # appends to all findings
-            for key, value in findings.items():
-                if key not in all_findings:
-                    all_findings[key] = value
-                else:
-                    all_findings[key].extend(value)
+            findings, count = file_findings[file_index]
+        print(f"Finished {in_path}. reference count: {count}")
+        all_findings.extend(findings)
+    cache_stats = matcher.cache_stats()
+    if cache_stats["hits"] + cache_stats["misses"] > 0:
+        print(
+            f'Line cache: {cache_stats["hits"]} hits, {cache_stats["misses"]} misses '
+            f'({cache_stats["hit_rate"]:.1%})'
+        )
+    return all_findings
+
+
+def find(
+    issue_file_path: str,
+    input_paths: list,
+    output_path: str,
+    workers: int = 1,
+    state_path: str = None,
+    date_window: tuple = None,
+    store_path: str = None,
+):
+    """
+    Finds all issue references like ``find_all`` and writes them to the output json.
+    With a ``store_path``, they are loaded into a SQLite findings store as well.
+    """
+    all_findings = find_all(
+        issue_file_path, input_paths, workers, state_path, date_window
+    )
     with open(output_path, "w+", encoding="utf-8") as output_file:
-        output_file.write(json.dumps(all_findings, indent=4))
+        write_json_items(output_file, all_findings.iter_issue_groups())
+    if store_path is not None:
+        build_store(store_path, all_findings).close()
+
+
+def find_streaming(issue_file_path: str, input_paths: list, output_path: str):
+    """
+    Finds all issue references in the provided text files and writes
+    every find to an NDJSON file as soon as it is found.
+    The files are read through mmap and finds are not kept in memory;
+    ``findings_io.ndjson_to_json`` turns the output into the legacy json.
+    """
+    print("new start")
+    matcher = IssueMatcher(load_issues(issue_file_path))
+    with open(output_path, "w", encoding="utf-8", buffering=1) as output_file:
+        for in_path in input_paths:
+            print(f"Starting {in_path}")
+            count = 0
+            for issue, message, line_index, line, offset in ReferenceScanner(
+                matcher
+            ).scan(iter_lines(in_path)):
+                entry = build_entry(message, line_index, line, issue, offset)
+                write_finding(output_file, issue, entry)
+                count += 1
+            print(f"Finished {in_path}. reference count: {count}")
 
 
 ISSUE_FILE_PATH = "./data/IssuesDatasetArchitectural.xlsx"
+WORKERS = os.cpu_count()
+
+if __name__ == "__main__":
+    # Final
+    find(
+        ISSUE_FILE_PATH,
+        ["./data/the_best_exported_data/the_data.txt"],
+        "./data/the_best_exported_data/findings.json",
+        WORKERS,
+        state_path="./data/the_best_exported_data/findings.state.json",
+        store_path="./data/the_best_exported_data/findings.sqlite",
+    )
+
+    # Revised
+    # find(
+    #     ISSUE_FILE_PATH,
+    #     [
+    #         "./data/finder/issues-1.txt",
+    #         "./data/finder/issues-2.txt",
+    #         "./data/finder/issues-3.txt",
+    #         "./data/finder/issues-4.txt",
+    #         "./data/finder/issues-5.txt",
+    #         "./data/finder/issues-6.txt",
+    #         "./data/finder/issues-7.txt",
+    #     ],
+    #     "./data/finder/findings.json",
+    #     WORKERS,
+    # )
 
-# Final
-find(
-    ISSUE_FILE_PATH,
-    ["./data/the_best_exported_data/the_data.txt"],
-    "./data/the_best_exported_data/findings.json",
-)
-
-# Revised
-# find(
-#     ISSUE_FILE_PATH,
-#     [
-#         "./data/finder/issues-1.txt",
-#         "./data/finder/issues-2.txt",
-#         "./data/finder/issues-3.txt",
-#         "./data/finder/issues-4.txt",
-#         "./data/finder/issues-5.txt",
-#         "./data/finder/issues-6.txt",
-#         "./data/finder/issues-7.txt",
-#     ],
-#     "./data/finder/findings.json",
-# )
-
-
-# Original
-# find(
-#     ISSUE_FILE_PATH,
-#     ["./data/find_issues_in_text/the_text.txt"],
-#     "./data/find_issues_in_text/the_output.json",
-# )
+    # Original
+    # find(
+    #     ISSUE_FILE_PATH,
+    #     ["./data/find_issues_in_text/the_text.txt"],
+    #     "./data/find_issues_in_text/the_output.json",
+    # )
@@ -0,0 +1,209 @@
+"""
+Batched statistical tests on contingency tables, used by ``test_independence.py``.
+"""
+
+import itertools
+
+import numpy as np
+from scipy.special import gammaln
+from scipy.stats import chi2, hypergeom
+
+# number of tables whose p-values a Fisher engine remembers.
+FISHER_CACHE_SIZE = 1 << 16
+# relative tolerance under which a table counts as at most as likely as the observed.
+FISHER_TIE_TOLERANCE = 1e-7
+# support values of the tables whose two-sided p-values are computed at once.
+FISHER_CHUNK_CELLS = 1 << 22
+# smallest expected cell count for which the chi-square approximation is trusted.
+MIN_EXPECTED = 5
+
+
+class FisherEngine:
+    """
+    Fisher's exact test on 2x2 tables, with the conventions of
+    ``scipy.stats.fisher_exact``. All p-values of a batch come from vectorized
+    hypergeometric evaluations, and results are memoized per table, so repeated
+    tables are tested once. A table and its transpose share one memo entry, as
+    their p-values are the same. The memo keeps the ``cache_size`` most recently
+    computed tables.
+    """
+
+    def __init__(self, cache_size: int = FISHER_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = {}
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def test(self, table) -> tuple:
+        """Returns the (lower, greater, two-sided) p-values of one table."""
+        return tuple(self.test_batch(np.asarray(table).reshape(1, 2, 2))[0].tolist())
+
+    def test_batch(self, tables: np.ndarray) -> np.ndarray:
+        """
+        Tests an array of shape (k, 2, 2) and returns the p-values as shape (k, 3):
+        lower, greater and two-sided.
+        """
+        flat = np.asarray(tables, dtype=np.int64).reshape(-1, 4)
+        # (a, b, c, d) and its transpose (a, c, b, d) are stored as the one with b <= c.
+        flat = np.where((flat[:, 1] > flat[:, 2])[:, None], flat[:, [0, 2, 1, 3]], flat)
+        unique, inverse = np.unique(flat, axis=0, return_inverse=True)
+        keys = [tuple(row) for row in unique.tolist()]
+        found = {key: self._cache[key] for key in keys if key in self._cache}
+        missing = [index for index, key in enumerate(keys) if key not in found]
+        if len(missing) > 0:
+            p_values = self._compute(unique[missing])
+            for index, row in zip(missing, p_values.tolist()):
+                found[keys[index]] = row
+                self._cache[keys[index]] = row
+            # the oldest tables are forgotten first.
+            excess = max(0, len(self) - self.cache_size)
+            for key in list(itertools.islice(self._cache, excess)):
+                del self._cache[key]
+        unique_p = np.array([found[key] for key in keys], dtype=np.float64)
+        return unique_p.reshape(-1, 3)[inverse.reshape(-1)]
+
+    def _compute(self, flat: np.ndarray) -> np.ndarray:
+        """Computes the p-values of distinct tables given as rows of (a, b, c, d)."""
+        p_values = np.ones((flat.shape[0], 3), dtype=np.float64)
+        row_0 = flat[:, 0] + flat[:, 1]
+        row_1 = flat[:, 2] + flat[:, 3]
+        col_0 = flat[:, 0] + flat[:, 2]
+        col_1 = flat[:, 1] + flat[:, 3]
+        # tables with an empty row or column have a p-value of 1.
+        testable = np.flatnonzero((row_0 > 0) & (row_1 > 0) & (col_0 > 0) & (col_1 > 0))
+        if len(testable) == 0:
+            return p_values
+        total = (row_0 + row_1)[testable]
+        row_0 = row_0[testable]
+        # the one-sided p-values are the tails scipy uses, evaluated in one call each.
+        lower = hypergeom.cdf(flat[testable, 0], total, row_0, col_0[testable])
+        greater = hypergeom.cdf(flat[testable, 1], total, row_0, col_1[testable])
+        p_values[testable, 0] = np.minimum(lower, 1.0)
+        p_values[testable, 1] = np.minimum(greater, 1.0)
+        p_values[testable, 2] = _two_sided(flat[testable])
+        return p_values
+
+
+def _two_sided(flat: np.ndarray) -> np.ndarray:
+    """
+    Two-sided p-values of testable tables given as rows of (a, b, c, d): the sum
+    of the probabilities of all tables that are at most as likely as the observed
+    one, within ``FISHER_TIE_TOLERANCE``. The hypergeometric distribution is
+    unimodal, so the more likely tables form one run of ``a`` values around the
+    mode; the p-value is the cdf below that run plus the sf above it.
+    """
+    row_0 = flat[:, 0] + flat[:, 1]
+    row_1 = flat[:, 2] + flat[:, 3]
+    col_0 = flat[:, 0] + flat[:, 2]
+    total = row_0 + row_1
+    low = np.maximum(0, col_0 - row_1)
+    sizes = np.minimum(row_0, col_0) - low + 1
+    log_factorials = gammaln(np.arange(total.max() + 1) + 1.0)
+
+    def log_weight(a, row_0, row_1, col_0):
+        # the log pmf without the terms that only depend on the margins.
+        return -(
+            log_factorials[a]
+            + log_factorials[row_0 - a]
+            + log_factorials[col_0 - a]
+            + log_factorials[row_1 - col_0 + a]
+        )
+
+    limit = np.log1p(FISHER_TIE_TOLERANCE)
+    first = np.empty(len(flat), dtype=np.int64)
+    count = np.empty(len(flat), dtype=np.int64)
+    beyond_support = total.max() + 1
+    start = 0
+    while start < len(flat):
+        cells = np.cumsum(sizes[start:])
+        # at least one table per chunk, however large its support.
+        stop = start + max(1, int(np.searchsorted(cells, FISHER_CHUNK_CELLS, "right")))
+        chunk = slice(start, stop)
+        offsets = np.concatenate(([0], cells[: stop - start - 1]))
+        # every possible a of every table in the chunk, one run per table.
+        a = np.arange(cells[stop - start - 1]) - np.repeat(
+            offsets - low[chunk], sizes[chunk]
+        )
+        margins = [margin[chunk] for margin in (row_0, row_1, col_0)]
+        observed = log_weight(flat[chunk, 0], *margins)
+        repeated = [np.repeat(margin, sizes[chunk]) for margin in margins]
+        weights = log_weight(a, *repeated)
+        above = weights - np.repeat(observed, sizes[chunk]) > limit
+        count[chunk] = np.add.reduceat(above, offsets)
+        first[chunk] = np.minimum.reduceat(np.where(above, a, beyond_support), offsets)
+        start = stop
+    p_values = np.ones(len(flat), dtype=np.float64)
+    tails = np.flatnonzero(count > 0)
+    if len(tails) > 0:
+        args = (total[tails], row_0[tails], col_0[tails])
+        below = hypergeom.cdf(first[tails] - 1, *args)
+        beyond = hypergeom.sf(first[tails] + count[tails] - 1, *args)
+        p_values[tails] = np.minimum(below + beyond, 1.0)
+    return p_values
+
+
+def expected_counts(tables: np.ndarray) -> np.ndarray:
+    """Expected cell counts under independence, for tables of shape (k, r, c)."""
+    tables = np.asarray(tables, dtype=np.float64)
+    totals = tables.sum(axis=(1, 2), keepdims=True)
+    row_sums = tables.sum(axis=2, keepdims=True)
+    col_sums = tables.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, row_sums * col_sums / totals, 0.0)
+
+
+def chi_square_batch(tables: np.ndarray, correction: bool = True) -> tuple:
+    """
+    Pearson's chi-square test of independence on tables of shape (k, r, c),
+    with the conventions of ``scipy.stats.chi2_contingency``: Yates' correction
+    for 2x2 tables when ``correction`` is set, and p = 1 without degrees of freedom.
+    Tables with an empty row or column can't be tested and get NaN.
+    Returns the statistics, the degrees of freedom, the p-values and the expected counts.
+    """
+    observed = np.asarray(tables, dtype=np.float64)
+    expected = expected_counts(observed)
+    rows, cols = observed.shape[1:]
+    dof = (rows - 1) * (cols - 1)
+    if dof == 0:
+        count = observed.shape[0]
+        return np.zeros(count), dof, np.ones(count), expected
+    difference = observed - expected
+    if correction and dof == 1:
+        difference = np.sign(difference) * np.maximum(np.abs(difference) - 0.5, 0.0)
+    testable = np.all(expected > 0, axis=(1, 2))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        terms = np.where(expected > 0, difference**2 / expected, 0.0)
+    statistics = np.where(testable, terms.sum(axis=(1, 2)), np.nan)
+    p_values = np.where(testable, chi2.sf(statistics, dof), np.nan)
+    return statistics, dof, p_values, expected
+
+
+def independence_tests(
+    tables: np.ndarray, fisher: FisherEngine = None, min_expected: float = MIN_EXPECTED
+) -> dict:
+    """
+    Tests tables of shape (k, r, c) with the chi-square test first. For 2x2 tables
+    with an expected count below ``min_expected`` the two-sided Fisher exact
+    p-value is used instead; larger tables with low counts are only flagged.
+    Returns arrays ``statistic``, ``chi2_p``, ``p``, ``fisher`` (whether the
+    Fisher test was used) and ``low_expected``, and the degrees of freedom ``dof``.
+    """
+    tables = np.asarray(tables, dtype=np.int64)
+    statistics, dof, chi2_p, expected = chi_square_batch(tables)
+    low_expected = np.any(expected < min_expected, axis=(1, 2))
+    p_values = chi2_p.copy()
+    use_fisher = np.zeros(len(tables), dtype=bool)
+    if tables.shape[1:] == (2, 2):
+        use_fisher = low_expected
+        if np.any(use_fisher):
+            fisher = fisher if fisher is not None else FisherEngine()
+            p_values[use_fisher] = fisher.test_batch(tables[use_fisher])[:, 2]
+    return {
+        "statistic": statistics,
+        "dof": dof,
+        "chi2_p": chi2_p,
+        "p": p_values,
+        "fisher": use_fisher,
+        "low_expected": low_expected,
+    }
@@ -0,0 +1,91 @@
+"""
+Helpers for reading the txt export of the data browser in pieces.
+The export is a flat list of messages, each starting with a ``Message id:`` line.
+"""
+
+import os
+from mmap import mmap, ACCESS_READ
+
+MESSAGE_ID = "Message id: "
+MESSAGE_START = f"\n{MESSAGE_ID}".encode("utf-8")
+
+
+def message_shards(file_path: str, count: int) -> list:
+    """
+    Splits the file in at most ``count`` byte ranges of similar size.
+    Every range, except the first, starts on a ``Message id:`` line.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0 or count <= 1:
+        return [(0, size)]
+    starts = [0]
+    with open(file_path, "rb") as data_file:
+        with mmap(data_file.fileno(), 0, access=ACCESS_READ) as data:
+            for shard in range(1, count):
+                target = max(size * shard // count, starts[-1])
+                position = data.find(MESSAGE_START, max(target - 1, 0))
+                if position == -1:
+                    break
+                if position + 1 > starts[-1]:
+                    starts.append(position + 1)
+    ends = starts[1:] + [size]
+    return list(zip(starts, ends))
+
+
+def decode_line(raw_line: bytes) -> list:
+    """
+    Decodes a raw line, which ends on ``\\n``, into the lines text mode reads,
+    since text mode also breaks lines on a lone ``\\r``.
+    """
+    line = raw_line.decode("utf-8")
+    if "\r" not in line:
+        return [line]
+    parts = line.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    if parts[-1] == "":
+        parts.pop()
+    return [f"{part}\n" for part in parts]
+
+
+def iter_raw_lines(file_path: str, start: int = 0, end: int = None):
+    """Yields ``(offset, raw_line)`` between two byte offsets, read through mmap."""
+    if os.path.getsize(file_path) == 0:
+        return
+    with open(file_path, "rb") as data_file:
+        with mmap(data_file.fileno(), 0, access=ACCESS_READ) as data:
+            data.seek(start)
+            position = start
+            while end is None or position < end:
+                raw_line = data.readline()
+                if not raw_line:
+                    break
+                yield position, raw_line
+                position += len(raw_line)
+
+
+def iter_lines(file_path: str, start: int = 0, end: int = None):
+    """
+    Yields the lines between two byte offsets of the file, read through mmap.
+    Line breaks are handled like text mode does (``\\n``, ``\\r\\n`` and ``\\r``),
+    so line counts match ``enumerate(open(file_path))``.
+    """
+    for _, raw_line in iter_raw_lines(file_path, start, end):
+        yield from decode_line(raw_line)
+
+
+def iter_message_blocks(lines):
+    """
+    Groups the lines per message and yields ``(message_id, lines)``.
+    Lines before the first message are yielded with an empty message id.
+    """
+    message_id = ""
+    block = []
+    for line in lines:
+        the_line = line.strip()
+        if the_line.startswith(MESSAGE_ID):
+            if len(block) > 0:
+                yield message_id, block
+            message_id = the_line[len(MESSAGE_ID) :].strip()
+            block = []
+        block.append(line)
+    if len(block) > 0:
+        yield message_id, block
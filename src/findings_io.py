@@ -0,0 +1,141 @@
+"""
+Reading and writing of issue findings as NDJSON.
+Every line holds one find: the issue key under ``issue`` plus the find itself.
+The grouped json written by ``better_find_issues_in_text.find`` can be rebuilt from it.
+"""
+
+import json
+
+from stage_metrics import timed
+
+CHUNK_SIZE = 1 << 20
+WHITESPACE = " \t\n\r"
+
+
+def write_finding(output_file, issue: str, entry: dict):
+    """Writes one find as an NDJSON record."""
+    output_file.write(json.dumps({"issue": issue, **entry}))
+    output_file.write("\n")
+
+
+def iter_findings(ndjson_path: str):
+    """Yields ``(issue, entry)`` for every record in the NDJSON file."""
+    with open(ndjson_path, "r", encoding="utf-8") as input_file:
+        for line in input_file:
+            if line.strip() == "":
+                continue
+            entry = json.loads(line)
+            issue = entry.pop("issue")
+            yield issue, entry
+
+
+class _JsonReader:
+    """Reads a json document piece by piece from a text file."""
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def _fill(self) -> bool:
+        chunk = self.input_file.read(CHUNK_SIZE)
+        if not chunk:
+            return False
+        self.buffer = f"{self.buffer[self.position:]}{chunk}"
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character; "" at the end."""
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in WHITESPACE
+            ):
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ""
+
+    def take(self, expected: str) -> str:
+        """Consumes the next character, which must be one of ``expected``."""
+        char = self.peek()
+        if char == "" or char not in expected:
+            raise ValueError(f"Expected one of {expected!r} at {char!r}")
+        self.position += 1
+        return char
+
+    def value(self):
+        """Decodes the next json value."""
+        self.peek()
+        while True:
+            try:
+                value, self.position = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+                return value
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+
+def iter_json_findings(json_path: str):
+    """
+    Yields ``(issue, entry)`` for every find in a legacy findings json,
+    reading one find at a time instead of loading the whole file.
+    """
+    with open(json_path, "r", encoding="utf-8") as input_file:
+        reader = _JsonReader(input_file)
+        reader.take("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            issue = reader.value()
+            reader.take(":")
+            reader.take("[")
+            if reader.peek() == "]":
+                reader.take("]")
+            else:
+                while True:
+                    yield issue, reader.value()
+                    if reader.take(",]") == "]":
+                        break
+            if reader.take(",}") == "}":
+                return
+
+
+def load_findings(ndjson_path: str) -> dict:
+    """Groups the NDJSON records per issue, like the legacy findings json."""
+    findings = {}
+    for issue, entry in iter_findings(ndjson_path):
+        if issue not in findings:
+            findings[issue] = []
+        findings[issue].append(entry)
+    return findings
+
+
+def ndjson_to_json(ndjson_path: str, output_path: str):
+    """Converts NDJSON findings to the legacy findings json."""
+    with open(output_path, "w+", encoding="utf-8") as output_file:
+        output_file.write(json.dumps(load_findings(ndjson_path), indent=4))
+
+
+@timed(items=lambda count, *_: count)
+def write_json_items(output_file, items):
+    """
+    Writes ``(key, value)`` pairs as a json object, one pair at a time.
+    The text is the same as ``json.dumps(dict(items), indent=4)``.
+    Returns the number of pairs written.
+    """
+    empty = True
+    count = 0
+    for key, value in items:
+        output_file.write("{\n    " if empty else ",\n    ")
+        empty = False
+        value_text = json.dumps(value, indent=4).replace("\n", "\n    ")
+        output_file.write(f"{json.dumps(key)}: {value_text}")
+        count += 1
+    output_file.write("{}" if empty else "\n}")
+    return count
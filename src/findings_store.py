@@ -0,0 +1,332 @@
+"""
+SQLite store of issue findings, so analyses can query the references instead
+of reloading and regrouping the findings json.
+
+Tables:
+- ``messages``: meta data per message, with the normalized thread subject.
+- ``field_orders``: the orders of the meta data fields in the json entries.
+- ``tags``: one row per tag of a message.
+- ``issues``: the referenced issue variants and their full issue key.
+- ``lines``: the text of every line with a reference.
+- ``hits``: one row per reference, pointing to the above.
+
+The query helpers reproduce the findings json, the per-email view of
+``restructure_found_issues.py`` and the counts of ``thread_issue_referencer.py``.
+"""
+
+import json
+import os
+import sqlite3
+
+from findings_table import FindingsTable, build_entry
+from thread_issue_referencer import issue_key_table, normalize_subject, tag_maps
+
+SCHEMA = """
+CREATE TABLE field_orders (id INTEGER PRIMARY KEY, fields TEXT);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT,
+    email_id TEXT,
+    subject TEXT,
+    thread TEXT,
+    date TEXT,
+    sent_from TEXT,
+    tags TEXT,
+    field_order INTEGER
+);
+CREATE TABLE tags (message INTEGER, tag TEXT);
+CREATE TABLE issues (id INTEGER PRIMARY KEY, issue TEXT UNIQUE, issue_key TEXT);
+CREATE TABLE lines (id INTEGER PRIMARY KEY, text TEXT);
+CREATE TABLE hits (
+    id INTEGER PRIMARY KEY,
+    message INTEGER,
+    issue INTEGER,
+    line_index INTEGER,
+    line INTEGER,
+    offset INTEGER
+);
+"""
+INDEXES = """
+CREATE INDEX issues_issue_key ON issues (issue_key);
+CREATE INDEX messages_email_id ON messages (email_id);
+CREATE INDEX messages_thread ON messages (thread);
+CREATE INDEX tags_tag ON tags (tag, message);
+CREATE INDEX hits_issue ON hits (issue);
+CREATE INDEX hits_message ON hits (message);
+"""
+HIT_FIELDS = ("line_index", "line", "offset", "re_finds")
+
+
+def thread_subject(subject: str):
+    """The thread a subject belongs to, as ``thread_issue_referencer`` counts it."""
+    if subject is None or len(subject) < 3:
+        return subject
+    return normalize_subject(subject)
+
+
+def table_from_findings(findings: dict) -> FindingsTable:
+    """Rebuilds a findings table from the findings json keyed by issue."""
+    table = FindingsTable()
+    messages = {}
+    for issue, entries in findings.items():
+        for entry in entries:
+            message = {
+                key: value for key, value in entry.items() if key not in HIT_FIELDS
+            }
+            # one shared dict per message, the table recognizes messages by identity.
+            message = messages.setdefault(json.dumps(message), message)
+            line_index, line = entry["line_index"], entry["line"]
+            table.add(issue, message, line_index, line, entry["offset"])
+    return table
+
+
+def build_store(store_path: str, findings, t_map: dict = None) -> sqlite3.Connection:
+    """
+    Creates the store from a findings table or the findings json keyed by issue,
+    replacing an existing one. Returns the open connection.
+    """
+    if isinstance(findings, dict):
+        findings = table_from_findings(findings)
+    t_map = t_map if t_map is not None else tag_maps
+    if os.path.exists(store_path):
+        os.remove(store_path)
+    connection = sqlite3.connect(store_path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    with connection:
+        connection.executescript(SCHEMA)
+        field_orders = {}
+        for record in findings.messages:
+            field_orders.setdefault(record.field_order, len(field_orders))
+        connection.executemany(
+            "INSERT INTO field_orders VALUES (?, ?)",
+            (
+                (index, json.dumps(field_order))
+                for field_order, index in field_orders.items()
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    index,
+                    record.id,
+                    record.email_id,
+                    record.subject,
+                    thread_subject(record.subject),
+                    record.date,
+                    record.sent_from,
+                    json.dumps(record.tags) if record.tags is not None else None,
+                    field_orders[record.field_order],
+                )
+                for index, record in enumerate(findings.messages)
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO tags VALUES (?, ?)",
+            (
+                (index, tag)
+                for index, record in enumerate(findings.messages)
+                for tag in set(record.tags or ())
+            ),
+        )
+        key_table = issue_key_table(findings.issues, t_map)
+        connection.executemany(
+            "INSERT INTO issues VALUES (?, ?, ?)",
+            (
+                (index, issue, key_table.get(issue))
+                for index, issue in enumerate(findings.issues)
+            ),
+        )
+        connection.executemany(
+            "INSERT INTO lines VALUES (?, ?)", enumerate(findings.lines)
+        )
+        connection.executemany(
+            "INSERT INTO hits VALUES (?, ?, ?, ?, ?, ?)",
+            zip(
+                range(len(findings)),
+                findings.hit_message,
+                findings.hit_issue,
+                findings.hit_line_index,
+                findings.hit_line,
+                findings.hit_offset,
+            ),
+        )
+        connection.executescript(INDEXES)
+    return connection
+
+
+def open_store(store_path: str) -> sqlite3.Connection:
+    return sqlite3.connect(store_path, check_same_thread=False)
+
+
+def _message_reader(connection: sqlite3.Connection):
+    """Returns a function turning a message row into the legacy meta data dict."""
+    field_orders = {
+        index: json.loads(fields)
+        for index, fields in connection.execute("SELECT id, fields FROM field_orders")
+    }
+
+    def read(message_id, email_id, subject, date, sent_from, tags, field_order) -> dict:
+        values = {
+            "id": message_id,
+            "email_id": email_id,
+            "subject": subject,
+            "date": date,
+            "sent_from": sent_from,
+            "tags": json.loads(tags) if tags is not None else None,
+        }
+        return {
+            field: values[field]
+            for field in field_orders[field_order]
+            if values[field] is not None
+        }
+
+    return read
+
+
+def iter_issue_groups(connection: sqlite3.Connection):
+    """Yields ``(issue, entries)`` like the findings json keyed by issue."""
+    read_message = _message_reader(connection)
+    rows = connection.execute(
+        """
+        SELECT i.issue, m.message_id, m.email_id, m.subject, m.date, m.sent_from,
+               m.tags, m.field_order, h.line_index, l.text, h.offset
+        FROM hits h
+        JOIN issues i ON i.id = h.issue
+        JOIN messages m ON m.id = h.message
+        JOIN lines l ON l.id = h.line
+        ORDER BY h.issue, h.id
+        """
+    )
+    current_issue = None
+    entries = []
+    for issue, *message, line_index, line, offset in rows:
+        if issue != current_issue:
+            if current_issue is not None:
+                yield current_issue, entries
+            current_issue = issue
+            entries = []
+        message = read_message(*message)
+        entries.append(build_entry(message, line_index, line, issue, offset))
+    if current_issue is not None:
+        yield current_issue, entries
+
+
+def iter_email_groups(connection: sqlite3.Connection):
+    """
+    Yields ``(message id, group)`` like ``restructure_found_issues.py``: emails
+    in order of their first reference in the findings json, the meta data of
+    that reference, and the first reference to every issue.
+    """
+    read_message = _message_reader(connection)
+    rows = connection.execute(
+        """
+        WITH ordered AS (
+            SELECT h.id, h.issue, m.message_id,
+                   ROW_NUMBER() OVER (ORDER BY h.issue, h.id) AS position
+            FROM hits h JOIN messages m ON m.id = h.message
+        ),
+        firsts AS (
+            SELECT message_id, issue, MIN(position) AS position,
+                   MIN(MIN(position)) OVER (PARTITION BY message_id) AS email_position
+            FROM ordered
+            GROUP BY message_id, issue
+        )
+        SELECT i.issue, m.message_id, m.email_id, m.subject, m.date, m.sent_from,
+               m.tags, m.field_order, h.line_index, l.text, h.offset, f.email_position
+        FROM firsts f
+        JOIN ordered o ON o.position = f.position
+        JOIN hits h ON h.id = o.id
+        JOIN issues i ON i.id = h.issue
+        JOIN messages m ON m.id = h.message
+        JOIN lines l ON l.id = h.line
+        ORDER BY f.email_position, f.position
+        """
+    )
+    current_position = None
+    current_id = None
+    group = None
+    for issue, *message, line_index, line, offset, email_position in rows:
+        if email_position != current_position:
+            if group is not None:
+                yield current_id, group
+            current_position = email_position
+            group = read_message(*message)
+            current_id = group.pop("id")
+            group["issues"] = {}
+        group["issues"][issue] = build_entry({}, line_index, line, issue, offset)
+    if group is not None:
+        yield current_id, group
+
+
+def reference_counts(connection: sqlite3.Connection, tags: list) -> tuple:
+    """
+    Counts the references of messages with any of the tags, like
+    ``thread_issue_referencer.handle``: unique emails, unique threads and the
+    issue variants referenced per issue key.
+    """
+    placeholders = ", ".join("?" for _ in tags)
+    tagged = f"""
+        SELECT DISTINCT h.message, h.issue FROM hits h
+        WHERE h.message IN (SELECT message FROM tags WHERE tag IN ({placeholders}))
+    """
+    emails = connection.execute(
+        f"""
+        SELECT DISTINCT m.email_id FROM ({tagged}) r JOIN messages m ON m.id = r.message
+        """,
+        tags,
+    ).fetchall()
+    threads = connection.execute(
+        f"""
+        SELECT DISTINCT m.thread FROM ({tagged}) r JOIN messages m ON m.id = r.message
+        """,
+        tags,
+    ).fetchall()
+    issues = {}
+    for issue_key, issue in connection.execute(
+        f"""
+        SELECT DISTINCT i.issue_key, i.issue
+        FROM ({tagged}) r JOIN issues i ON i.id = r.issue
+        """,
+        tags,
+    ):
+        issues.setdefault(issue_key, []).append(issue)
+    return [row[0] for row in emails], [row[0] for row in threads], issues
+
+
+def threads_referencing(
+    connection: sqlite3.Connection, project: str, tags: list
+) -> list:
+    """
+    Returns the threads with messages that carry any of the tags and reference
+    issues of the project, e.g. the YARN threads tagged "Issue Impact".
+    """
+    placeholders = ", ".join("?" for _ in tags)
+    return [
+        row[0]
+        for row in connection.execute(
+            f"""
+            SELECT DISTINCT m.thread
+            FROM hits h
+            JOIN issues i ON i.id = h.issue
+            JOIN messages m ON m.id = h.message
+            WHERE i.issue_key GLOB ? || '-*'
+              AND h.message IN (SELECT message FROM tags WHERE tag IN ({placeholders}))
+            ORDER BY m.thread
+            """,
+            [project, *tags],
+        )
+    ]
+
+
+INPUT_FILE = "./data/the_best_exported_data/findings.json"
+STORE_PATH = "./data/the_best_exported_data/findings.sqlite"
+
+if __name__ == "__main__":
+    with open(INPUT_FILE, "r", encoding="utf-8") as input_file:
+        store = build_store(STORE_PATH, json.loads(input_file.read()))
+    threads = threads_referencing(store, "YARN", ["Issue Impact"])
+    print(json.dumps(threads, indent=4))
+    print(f"YARN threads tagged Issue Impact: {len(threads)}")
+    store.close()
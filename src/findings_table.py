@@ -0,0 +1,174 @@
+"""
+Compact in-memory storage of issue findings.
+Message meta data is stored once per message and every find is a row of
+integers, so a message that references many issues is not copied per find.
+The json views used by the other scripts are only built on demand.
+"""
+
+from array import array
+
+from issue_matcher import bounded_finds
+
+MESSAGE_FIELDS = ("id", "subject", "date", "sent_from", "email_id", "tags")
+
+
+class MessageRecord:
+    """
+    Meta data of one message; fields that were never set are None.
+    ``field_order`` holds the set fields in the order of the message dict,
+    which is the order they were first set in the file the message is from.
+    """
+
+    __slots__ = MESSAGE_FIELDS + ("field_order",)
+
+    def __init__(self, message: dict, field_order: tuple):
+        for field in MESSAGE_FIELDS:
+            setattr(self, field, message.get(field))
+        self.field_order = field_order
+
+
+def build_entry(
+    message: dict, line_index: int, line: str, issue: str, offset: int
+) -> dict:
+    """Builds the legacy json entry of a find."""
+    new_entry = dict(message)
+    new_entry["line_index"] = line_index
+    new_entry["line"] = line
+    new_entry["offset"] = offset
+    new_entry["re_finds"] = bounded_finds(issue, line)
+    return new_entry
+
+
+class FindingsTable:
+    """
+    Table of messages and a table of finds that refers to them.
+    Each find is stored as (message index, issue index, line index, offset)
+    plus the index of its line text, which is shared by all finds on that line.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.issues = []
+        self.lines = []
+        # the distinct field orders of the messages, shared by their records.
+        self._field_orders = {}
+        self.hit_message = array("q")
+        self.hit_issue = array("q")
+        self.hit_line_index = array("q")
+        self.hit_offset = array("q")
+        self.hit_line = array("q")
+        self._issue_index = {}
+        self._last_message = None
+        self._last_line_index = None
+
+    def __len__(self) -> int:
+        return len(self.hit_issue)
+
+    def _shared_order(self, field_order: tuple) -> tuple:
+        return self._field_orders.setdefault(field_order, field_order)
+
+    def _issue_id(self, issue: str) -> int:
+        if issue not in self._issue_index:
+            self._issue_index[issue] = len(self.issues)
+            self.issues.append(issue)
+        return self._issue_index[issue]
+
+    def add(self, issue: str, message: dict, line_index: int, line: str, offset: int):
+        """
+        Adds a find. Messages are recognized by identity, so the scanner
+        must hand out a new dict whenever the message meta data changes.
+        Consecutive finds share a line when both its index and text match;
+        finds read from several files can have the same line index.
+        """
+        if message is not self._last_message:
+            self._last_message = message
+            field_order = self._shared_order(tuple(message))
+            self.messages.append(MessageRecord(message, field_order))
+        if line_index != self._last_line_index or line != self.lines[-1]:
+            self._last_line_index = line_index
+            self.lines.append(line)
+        self.hit_message.append(len(self.messages) - 1)
+        self.hit_issue.append(self._issue_id(issue))
+        self.hit_line_index.append(line_index)
+        self.hit_offset.append(offset)
+        self.hit_line.append(len(self.lines) - 1)
+
+    def extend(self, other: "FindingsTable", line_offset: int = 0, carried: dict = None):
+        """
+        Appends the finds of another table.
+        ``carried`` holds meta data that was set before the other table started,
+        it fills the fields its messages did not set themselves.
+        """
+        carried = carried or {}
+        message_base = len(self.messages)
+        for record in other.messages:
+            for field, value in carried.items():
+                if getattr(record, field) is None:
+                    setattr(record, field, value)
+            # carried fields were set earlier in the file, so they come first.
+            field_order = tuple(carried) + tuple(
+                field for field in record.field_order if field not in carried
+            )
+            record.field_order = self._shared_order(field_order)
+            self.messages.append(record)
+        line_base = len(self.lines)
+        self.lines.extend(other.lines)
+        issue_map = [self._issue_id(issue) for issue in other.issues]
+        self.hit_message.extend(index + message_base for index in other.hit_message)
+        self.hit_issue.extend(issue_map[index] for index in other.hit_issue)
+        self.hit_line_index.extend(index + line_offset for index in other.hit_line_index)
+        self.hit_offset.extend(other.hit_offset)
+        self.hit_line.extend(index + line_base for index in other.hit_line)
+        self._last_message = None
+        self._last_line_index = None
+
+    def message_dict(self, message_index: int) -> dict:
+        """Returns the meta data of a message as the legacy dict."""
+        record = self.messages[message_index]
+        message = {}
+        for field in record.field_order:
+            value = getattr(record, field)
+            if value is not None:
+                message[field] = value
+        return message
+
+    def entry(self, hit: int) -> dict:
+        """Returns a find as the legacy json entry."""
+        return build_entry(
+            self.message_dict(self.hit_message[hit]),
+            self.hit_line_index[hit],
+            self.lines[self.hit_line[hit]],
+            self.issues[self.hit_issue[hit]],
+            self.hit_offset[hit],
+        )
+
+    def iter_issue_groups(self):
+        """Yields ``(issue, entries)`` in the order of the legacy findings json."""
+        hits_per_issue = [array("q") for _ in self.issues]
+        for hit, issue_index in enumerate(self.hit_issue):
+            hits_per_issue[issue_index].append(hit)
+        for issue, hits in zip(self.issues, hits_per_issue):
+            yield issue, [self.entry(hit) for hit in hits]
+
+    def to_issue_view(self) -> dict:
+        """Returns the findings keyed by issue (``findings.json``)."""
+        return dict(self.iter_issue_groups())
+
+    def to_email_view(self) -> dict:
+        """Returns the findings keyed by message id (``res_findings.json``)."""
+        results = {}
+        for issue, entries in self.iter_issue_groups():
+            for entry in entries:
+                message_id = entry.pop("id")
+                issue_entry = {
+                    "line_index": entry.pop("line_index"),
+                    "line": entry.pop("line"),
+                    "offset": entry.pop("offset"),
+                    "re_finds": entry.pop("re_finds"),
+                }
+                if message_id not in results:
+                    entry["issues"] = {}
+                    results[message_id] = entry
+                if issue not in results[message_id]["issues"]:
+                    results[message_id]["issues"][issue] = issue_entry
+        return results
@@ -2,13 +2,11 @@
 Generates query for the search engine from xlsx issue file.
 """
 
-import pandas as pd
+from issue_vocabulary import load_vocabulary
 
 DATA_FILE = "./data/IssuesDatasetArchitectural.xlsx"
 
-xl_file = pd.ExcelFile(DATA_FILE)
-
-df = pd.read_excel(DATA_FILE)
+issue_keys = load_vocabulary(DATA_FILE)["keys"]
 
 TEST_FOR_REPO_DIFF = False
 
@@ -18,8 +16,8 @@ QUERY = DEFQ
 
 PREV_REPO = ""
 
-for index, row in df.iterrows():
-    repo, key = row["issues key"].split("-")
+for issue_key in issue_keys:
+    repo, key = issue_key.split("-")
 
     if TEST_FOR_REPO_DIFF and repo != PREV_REPO:
         print(QUERY[3:])
@@ -30,5 +28,3 @@ for index, row in df.iterrows():
     QUERY = f'{QUERY} {key}'
 
 print(QUERY[3:])
-
-xl_file.close()
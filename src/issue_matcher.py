@@ -0,0 +1,142 @@
+"""
+Single-pass matcher for issue references.
+Compiles the complete issue vocabulary into one trie-shaped regular expression,
+so every reference in a line is found in one scan instead of one scan per issue.
+"""
+
+import re
+from functools import lru_cache
+
+DIGITS = "0123456789"
+QUOTE_PREFIX = "> \t"
+LINE_CACHE_SIZE = 2**16
+
+
+def _build_trie(issues: list) -> dict:
+    """Builds a character trie of the issues; the "" key marks an issue end."""
+    trie = {}
+    for issue in issues:
+        node = trie
+        for char in issue:
+            node = node.setdefault(char, {})
+        node[""] = True
+    return trie
+
+
+def _trie_to_pattern(node: dict) -> str:
+    """Converts a trie to a regex that prefers the longest issue it can match."""
+    branches = []
+    leaves = []
+    for char in sorted(key for key in node if key != ""):
+        child = node[char]
+        if len(child) == 1 and "" in child:
+            leaves.append(re.escape(char))
+        else:
+            branches.append(f"{re.escape(char)}{_trie_to_pattern(child)}")
+    if len(leaves) == 1:
+        branches.append(leaves[0])
+    elif len(leaves) > 1:
+        branches.append(f'[{"".join(leaves)}]')
+    if len(branches) == 0:
+        return ""
+    pattern = "|".join(branches)
+    if "" in node:
+        return f"(?:{pattern})?"
+    if len(branches) > 1:
+        return f"(?:{pattern})"
+    return pattern
+
+
+def bounded_finds(issue: str, line: str) -> list:
+    """Equivalent of ``re.findall(rf"{issue}[^0-9]", line)`` without the regex."""
+    finds = []
+    size = len(issue)
+    start = line.find(issue)
+    while start != -1:
+        end = start + size
+        if end < len(line) and line[end] not in DIGITS:
+            finds.append(line[start : end + 1])
+            start = line.find(issue, end + 1)
+        else:
+            start = line.find(issue, start + 1)
+    return finds
+
+
+class IssueMatcher:
+    """
+    Finds all issue references in a line in a single pass.
+    An issue counts as referenced when it is followed by a non-digit,
+    which is the same rule ``find_issues_in`` has always used.
+    Results are kept in an LRU cache keyed by the line without its reply
+    quote markers, as quoted text repeats a lot in mailing list exports.
+    """
+
+    def __init__(self, issues: list, cache_size: int = LINE_CACHE_SIZE):
+        self.issues = [issue for issue in issues if issue != ""]
+        # vocabulary order and multiplicity, so results keep the input order.
+        self._order = {}
+        self._counts = {}
+        for issue in self.issues:
+            self._order.setdefault(issue, len(self._order))
+            self._counts[issue] = self._counts.get(issue, 0) + 1
+        # The regex only reports the longest issue at each position;
+        # shorter issues are implied when the longer one continues with a non-digit.
+        self._implied = {}
+        for issue in self._order:
+            implied = tuple(
+                issue[:end]
+                for end in range(1, len(issue))
+                if issue[:end] in self._order and issue[end] not in DIGITS
+            )
+            if len(implied) > 0:
+                self._implied[issue] = implied
+        trie_pattern = _trie_to_pattern(_build_trie(self._order))
+        self._regex = (
+            re.compile(rf"(?=({trie_pattern})[^0-9])") if trie_pattern else None
+        )
+        # stripping quote markers can't change the matches when no issue starts with one.
+        self._normalize = not any(issue[0] in QUOTE_PREFIX for issue in self._order)
+        self._cached_match = lru_cache(maxsize=cache_size)(self._match_uncached)
+
+    def match(self, line: str) -> list:
+        """Returns the referenced issues in vocabulary order."""
+        if self._regex is None:
+            return []
+        if self._normalize:
+            line = line.lstrip(QUOTE_PREFIX)
+        return list(self._cached_match(line))
+
+    def cache_stats(self) -> dict:
+        """Returns the hit and miss counts of the line cache."""
+        info = self._cached_match.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "hit_rate": info.hits / lookups if lookups > 0 else 0.0,
+        }
+
+    def _match_uncached(self, line: str) -> tuple:
+        found = set()
+        for re_match in self._regex.finditer(line):
+            issue = re_match.group(1)
+            found.add(issue)
+            found.update(self._implied.get(issue, ()))
+        if len(found) == 0:
+            return ()
+        matches = []
+        for issue in sorted(found, key=self._order.__getitem__):
+            matches.extend([issue] * self._counts[issue])
+        return tuple(matches)
+
+    def in_vocabulary_order(self, issues: list) -> list:
+        """Sorts issues of this vocabulary in the order ``match`` returns them."""
+        return sorted(issues, key=self._order.__getitem__)
+
+    def find_references(self, line: str) -> list:
+        """Returns ``(issue, offset, re_finds)`` for every referenced issue."""
+        return [
+            (issue, line.find(issue), bounded_finds(issue, line))
+            for issue in self.match(line)
+        ]
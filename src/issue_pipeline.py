@@ -0,0 +1,313 @@
+"""
+Runs the issue-email study as one pipeline: finding the issue references,
+restructuring them per email, counting the referenced threads, preparing the
+classified email browser export and testing the tag co-occurrences.
+
+Stages form a dependency graph and hand their outputs to each other in memory.
+Every stage output is cached, keyed by the source of its function, its version,
+the hashes of its input files, its parameters and the keys of the stages it
+depends on, so a rerun only runs the stages whose inputs or code changed.
+Independent branches run concurrently in worker processes.
+"""
+
+import inspect
+import json
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from hashlib import blake2b
+
+import numpy as np
+
+from better_find_issues_in_text import find_all
+from findings_io import write_json_items
+from issue_vocabulary import file_hash
+from results_figure_prepper import INTERESTING_TAGS as PREPPER_TAGS
+from results_figure_prepper import load_dataset, tag_rows
+from test_independence import export, test_pairs
+from thread_issue_referencer import INTERESTING_TAGS as REFERENCE_TAGS
+from thread_issue_referencer import handle_many, tag_maps
+
+
+def stage(
+    name: str,
+    function,
+    depends: tuple = (),
+    params: dict = None,
+    files: dict = None,
+    outputs: tuple = (),
+    options: dict = None,
+    version: int = 1,
+) -> dict:
+    """
+    Declares a stage. It is run as ``function(*dependency outputs, **params,
+    **files, **options)``. ``files`` are input paths (or lists of paths) whose
+    contents are part of the cache key, ``params`` are hashed as they are, and
+    ``options`` don't change the output, so they aren't hashed. ``outputs``
+    names the parameters holding paths the stage writes; the cache is only
+    used while these exist. The source of ``function`` is part of the key;
+    bump ``version`` when code it calls changes its output.
+    """
+    return {
+        "name": name,
+        "function": function,
+        "depends": tuple(depends),
+        "params": params if params is not None else {},
+        "files": files if files is not None else {},
+        "outputs": tuple(outputs),
+        "options": options if options is not None else {},
+        "version": version,
+    }
+
+
+def _file_hashes(paths) -> list:
+    if isinstance(paths, str):
+        return file_hash(paths)
+    return [file_hash(path) for path in paths]
+
+
+def _source_hash(function) -> str:
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        # without source, e.g. for builtins, only the version invalidates the cache.
+        return ""
+    return blake2b(source.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def stage_key(spec: dict, dependency_keys: list) -> str:
+    """Hashes everything the output of a stage depends on."""
+    key = [
+        spec["name"],
+        spec["function"].__module__,
+        spec["function"].__qualname__,
+        _source_hash(spec["function"]),
+        spec["version"],
+        spec["params"],
+        {name: _file_hashes(paths) for name, paths in sorted(spec["files"].items())},
+        dependency_keys,
+    ]
+    return blake2b(
+        json.dumps(key, sort_keys=True, default=str).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def run_pipeline(stages: list, cache_dir: str = None, workers: int = 4) -> dict:
+    """
+    Runs the stages in dependency order, with independent stages in parallel
+    worker processes; with one worker, the stages run one after another in
+    this process. The workers are forked while this process has a single
+    thread and run every stage in their main thread, so a stage can start its
+    own process pool safely. Stages with a cached output are skipped; their
+    output is only loaded when a stage that has to run needs it.
+    Returns the available outputs per stage name.
+    """
+    specs = {spec["name"]: spec for spec in stages}
+    order = []
+    keys = {}
+    while len(order) < len(specs):
+        ready = [
+            name
+            for name, spec in specs.items()
+            if name not in keys and all(dep in keys for dep in spec["depends"])
+        ]
+        if len(ready) == 0:
+            raise ValueError("The stages have a cyclic or missing dependency.")
+        for name in ready:
+            spec = specs[name]
+            keys[name] = stage_key(spec, [keys[dep] for dep in spec["depends"]])
+            order.append(name)
+
+    def cache_path(name: str) -> str:
+        return os.path.join(cache_dir, f"{name}-{keys[name]}.pickle")
+
+    cached = set()
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name in order:
+            spec = specs[name]
+            outputs_exist = all(
+                os.path.exists({**spec["params"], **spec["options"]}[output])
+                for output in spec["outputs"]
+            )
+            if outputs_exist and os.path.exists(cache_path(name)):
+                cached.add(name)
+    to_run = [name for name in order if name not in cached]
+    results = {}
+    for name in sorted({dep for name in to_run for dep in specs[name]["depends"]}):
+        if name in cached:
+            with open(cache_path(name), "rb") as cache_file:
+                results[name] = pickle.load(cache_file)
+
+    def arguments(name: str) -> tuple:
+        spec = specs[name]
+        args = [results[dep] for dep in spec["depends"]]
+        return args, {**spec["params"], **spec["files"], **spec["options"]}
+
+    def finish(name: str, output):
+        results[name] = output
+        if cache_dir is not None:
+            temp_path = f"{cache_path(name)}.tmp"
+            with open(temp_path, "wb") as cache_file:
+                pickle.dump(output, cache_file)
+            os.replace(temp_path, cache_path(name))
+
+    print(f"Running {len(to_run)} of {len(order)} stage(s): {', '.join(to_run)}")
+    if workers <= 1:
+        for name in to_run:
+            args, kwargs = arguments(name)
+            finish(name, specs[name]["function"](*args, **kwargs))
+        return results
+    pending = {}
+    remaining = list(to_run)
+    # a fork pool starts all its workers before its management thread.
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        while len(remaining) > 0 or len(pending) > 0:
+            for name in list(remaining):
+                if all(dep in results for dep in specs[name]["depends"]):
+                    args, kwargs = arguments(name)
+                    future = pool.submit(specs[name]["function"], *args, **kwargs)
+                    pending[future] = name
+                    remaining.remove(name)
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(pending.pop(future), future.result())
+    return results
+
+
+def find_findings(issue_file_path: str, input_paths: list, workers: int = 1):
+    """Finds the issue references in the data browser exports."""
+    return find_all(issue_file_path, input_paths, workers)
+
+
+def write_findings(findings, output_path: str) -> str:
+    """Writes the findings keyed by issue."""
+    with open(output_path, "w+", encoding="utf-8") as output_file:
+        write_json_items(output_file, findings.iter_issue_groups())
+    return output_path
+
+
+def restructure_findings(findings, output_path: str) -> str:
+    """Writes the findings keyed by email, like ``restructure_found_issues.py``."""
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        write_json_items(output_file, findings.to_email_view().items())
+    return output_path
+
+
+def reference_counts(findings, tag_filters: dict) -> dict:
+    """Counts the unique emails, threads and issues per tag filter."""
+    return handle_many(findings.to_issue_view(), tag_filters, tag_maps)
+
+
+def write_reference_counts(counts: dict, output_path: str) -> str:
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        output_file.write(json.dumps(counts, indent=4))
+    return output_path
+
+
+def prepare_browser_export(data_path: str, interesting_tags: list) -> tuple:
+    """Returns the interesting tags and the tag rows of the classified emails."""
+    data_set = load_dataset(data_path, interesting_tags)
+    return interesting_tags, tag_rows(data_set, interesting_tags)
+
+
+def tag_independence(prepared: tuple) -> list:
+    """Tests the co-occurrence of every pair of interesting tags."""
+    interesting_tags, rows = prepared
+    matrix = np.array([values for _, _, values in rows], dtype=np.int64)
+    matrix = matrix.reshape(len(rows), len(interesting_tags))
+    return test_pairs(interesting_tags, interesting_tags, matrix, matrix)
+
+
+def export_independence(results: list, output_path: str) -> str:
+    export(results, output_path)
+    return output_path
+
+
+def issue_study_stages(
+    issue_file_path: str,
+    input_paths: list,
+    browser_export_path: str,
+    output_dir: str,
+    tag_filters: dict,
+    interesting_tags: list,
+    workers: int = 1,
+) -> list:
+    """Declares the stages of the issue-email study."""
+    return [
+        stage(
+            "find",
+            find_findings,
+            files={"issue_file_path": issue_file_path, "input_paths": input_paths},
+            options={"workers": workers},
+        ),
+        stage(
+            "findings_json",
+            write_findings,
+            ("find",),
+            params={"output_path": os.path.join(output_dir, "findings.json")},
+            outputs=("output_path",),
+        ),
+        stage(
+            "restructure",
+            restructure_findings,
+            ("find",),
+            params={"output_path": os.path.join(output_dir, "res_findings.json")},
+            outputs=("output_path",),
+        ),
+        stage(
+            "references",
+            reference_counts,
+            ("find",),
+            params={"tag_filters": tag_filters},
+        ),
+        stage(
+            "references_json",
+            write_reference_counts,
+            ("references",),
+            params={"output_path": os.path.join(output_dir, "references.json")},
+            outputs=("output_path",),
+        ),
+        stage(
+            "prepare",
+            prepare_browser_export,
+            files={"data_path": browser_export_path},
+            params={"interesting_tags": interesting_tags},
+        ),
+        stage("independence", tag_independence, ("prepare",)),
+        stage(
+            "independence_csv",
+            export_independence,
+            ("independence",),
+            params={"output_path": os.path.join(output_dir, "rel_vs_rel.csv")},
+            outputs=("output_path",),
+        ),
+    ]
+
+
+ISSUE_FILE_PATH = "./data/IssuesDatasetArchitectural.xlsx"
+INPUT_PATHS = ["./data/the_best_exported_data/the_data.txt"]
+BROWSER_EXPORT_PATH = "./data/data_prepper/the_data.csv"
+OUTPUT_DIR = "./data/issue_pipeline/"
+CACHE_DIR = "./data/issue_pipeline/cache/"
+WORKERS = os.cpu_count()
+
+if __name__ == "__main__":
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    run_pipeline(
+        issue_study_stages(
+            ISSUE_FILE_PATH,
+            INPUT_PATHS,
+            BROWSER_EXPORT_PATH,
+            OUTPUT_DIR,
+            {
+                "Excluding Irrelevant": REFERENCE_TAGS,
+                "Including Irrelevant": REFERENCE_TAGS + ["Architecturally Irrelevant"],
+            },
+            PREPPER_TAGS,
+            WORKERS,
+        ),
+        CACHE_DIR,
+    )
@@ -0,0 +1,72 @@
+"""
+Loads the issue keys from the xlsx file of architectural issues and expands
+them to the variants they are referenced with (``C123``, ``MR-123``, ...).
+The result is cached in a json file next to the xlsx file, keyed by its hash,
+so the finder and the query generator don't need to parse the sheet every run.
+"""
+
+import json
+import os
+from hashlib import sha256
+
+from openpyxl import load_workbook
+
+ISSUE_KEY_COLUMN = "issues key"
+
+
+def file_hash(file_path: str) -> str:
+    """Hashes the contents of a file."""
+    digest = sha256()
+    with open(file_path, "rb") as data_file:
+        for chunk in iter(lambda: data_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_issue_keys(issue_file_path: str) -> list:
+    """Streams the issue keys out of the first sheet in read-only mode."""
+    workbook = load_workbook(issue_file_path, read_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        column = list(next(rows)).index(ISSUE_KEY_COLUMN)
+        return [
+            row[column]
+            for row in rows
+            if len(row) > column and row[column] is not None
+        ]
+    finally:
+        workbook.close()
+
+
+def expand_variants(keys: list) -> list:
+    """Expands issue keys to all variants they can be referenced with."""
+    issues = []
+    for key in keys:
+        issue = key.strip()
+        issues.append(issue)
+        spl = issue.split("-")
+        if spl[0] != "HDFS":
+            prefix = issue[0] if issue[0] != "M" else "MR"
+            issues.append(f"{prefix}{spl[1]}")
+            issues.append(f"{prefix}-{spl[1]}")
+    return issues
+
+
+def load_vocabulary(issue_file_path: str, cache_path: str = None) -> dict:
+    """
+    Returns the issue vocabulary as ``{"keys": [...], "variants": [...]}``,
+    where keys are the raw cell values and variants the expanded issues.
+    """
+    if cache_path is None:
+        cache_path = f"{issue_file_path}.vocabulary.json"
+    issue_file_hash = file_hash(issue_file_path)
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as cache_file:
+            cached = json.loads(cache_file.read())
+        if cached["hash"] == issue_file_hash:
+            return cached["vocabulary"]
+    keys = read_issue_keys(issue_file_path)
+    vocabulary = {"keys": keys, "variants": expand_variants(keys)}
+    with open(cache_path, "w", encoding="utf-8") as cache_file:
+        cache_file.write(json.dumps({"hash": issue_file_hash, "vocabulary": vocabulary}))
+    return vocabulary
@@ -0,0 +1,152 @@
+"""
+Byte offset index of the messages in the txt export of the data browser.
+Any message, or all messages in a date range, can be read with a single seek
+per message instead of reading the export front to back.
+"""
+
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from data_browser_export import MESSAGE_ID, decode_line, iter_raw_lines
+
+INDEX_FIELDS = ("id", "email_id", "date", "sort_date", "start", "end", "first_line")
+ID, EMAIL_ID, DATE, SORT_DATE, START, END, FIRST_LINE = range(len(INDEX_FIELDS))
+
+
+def parse_date(date) -> str:
+    """Turns a message date into a sortable UTC ISO string; None if it can't be read."""
+    if isinstance(date, datetime):
+        parsed = date
+    else:
+        try:
+            parsed = parsedate_to_datetime(date)
+        except (TypeError, ValueError):
+            try:
+                parsed = datetime.fromisoformat(date)
+            except (TypeError, ValueError):
+                return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+class MessageIndex:
+    """Index rows of an export; every row holds the ``INDEX_FIELDS`` of a message."""
+
+    def __init__(self, export_path: str, rows: list):
+        self.export_path = export_path
+        self.rows = rows
+        self._by_id = {}
+        for row in rows:
+            self._by_id.setdefault(row[ID], row)
+        dated = sorted(
+            (row[SORT_DATE], position)
+            for position, row in enumerate(rows)
+            if row[SORT_DATE] is not None
+        )
+        self._dates = [sort_date for sort_date, _ in dated]
+        self._date_order = [position for _, position in dated]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def entry(self, row: list) -> dict:
+        """Returns an index row as a dict."""
+        return dict(zip(INDEX_FIELDS, row))
+
+    def read(self, row: list) -> str:
+        """Reads the full text of the message of an index row."""
+        with open(self.export_path, "rb") as export_file:
+            export_file.seek(row[START])
+            return export_file.read(row[END] - row[START]).decode("utf-8")
+
+    def get(self, message_id: str) -> str:
+        """Reads the first message with the id; None when there is none."""
+        row = self._by_id.get(message_id)
+        return None if row is None else self.read(row)
+
+    @staticmethod
+    def _bound(date) -> str:
+        sort_date = parse_date(date)
+        if sort_date is None:
+            raise ValueError(f"Can't read the date range bound {date!r}.")
+        return sort_date
+
+    def rows_between(self, start=None, end=None) -> list:
+        """
+        Returns the rows of the messages dated from ``start`` up to and including
+        ``end``, ordered by date. Bounds are datetimes or date strings; a bound
+        of None leaves that side of the range open.
+        Messages with an unreadable date are never part of a range.
+        """
+        low = 0 if start is None else bisect_left(self._dates, self._bound(start))
+        high = (
+            len(self._dates)
+            if end is None
+            else bisect_right(self._dates, self._bound(end))
+        )
+        return [self.rows[position] for position in self._date_order[low:high]]
+
+    def between(self, start=None, end=None):
+        """Yields ``(entry, text)`` for the messages in the date range."""
+        for row in self.rows_between(start, end):
+            yield self.entry(row), self.read(row)
+
+
+def build_message_index(export_path: str, index_path: str) -> MessageIndex:
+    """Builds the index of an export in one pass and stores it on disk."""
+    rows = []
+    current = None
+    line_number = 0
+    for offset, raw_line in iter_raw_lines(export_path):
+        lines = decode_line(raw_line)
+        first_line = lines[0].strip()
+        if first_line.startswith(MESSAGE_ID):
+            if current is not None:
+                current[END] = offset
+                rows.append(current)
+            current = [None] * len(INDEX_FIELDS)
+            current[ID] = first_line[len(MESSAGE_ID) :].strip()
+            current[START] = offset
+            current[FIRST_LINE] = line_number
+        elif current is not None:
+            # the last value wins, like it does in the issue finder.
+            for line in lines:
+                the_line = line.strip()
+                if the_line.startswith("Email id: "):
+                    current[EMAIL_ID] = the_line[len("Email id: ") :].strip()
+                elif the_line.startswith("Date: "):
+                    current[DATE] = the_line[len("Date: ") :].strip()
+        line_number += len(lines)
+    if current is not None:
+        current[END] = os.path.getsize(export_path)
+        rows.append(current)
+    for row in rows:
+        row[SORT_DATE] = None if row[DATE] is None else parse_date(row[DATE])
+    stat = os.stat(export_path)
+    with open(index_path, "w", encoding="utf-8") as index_file:
+        index_file.write(
+            json.dumps(
+                {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "fields": INDEX_FIELDS,
+                    "rows": rows,
+                }
+            )
+        )
+    return MessageIndex(export_path, rows)
+
+
+def load_message_index(export_path: str, index_path: str) -> MessageIndex:
+    """Loads the index of an export, (re)building it when it is missing or outdated."""
+    if os.path.exists(index_path):
+        stat = os.stat(export_path)
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            index = json.loads(index_file.read())
+        if index["size"] == stat.st_size and index["mtime_ns"] == stat.st_mtime_ns:
+            return MessageIndex(export_path, index["rows"])
+    return build_message_index(export_path, index_path)
@@ -1,42 +1,149 @@
 """
 restructures the output of ``better_find_issues_in_text.py``
 to have emails is primary entities instead of issue keys.
+The findings are read one find at a time. Once ``spill_threshold`` finds are
+buffered, the partial per-email groups are spilled to temporary runs sorted by
+email id. Merging those runs combines the groups of every email, which are then
+spilled again sorted by the position of the first find of the email, and merged
+into the output. Neither pass keeps a record of all emails in memory.
 """
 
-from copy import deepcopy
+import heapq
 import json
+import tempfile
 
-# OLD_INPUT_PATH = "./data/find_issues_in_text/the_output.json"
-
-with open("./data/finder/findings.json", "r", encoding="utf-8") as data_file:
-    data = json.loads(data_file.read())
-
-results = {}
-
-for issue, finds in data.items():
-    for find in finds:
-        if find["id"] not in results:
-            new_res = deepcopy(find)
-            del new_res["id"]
-            del new_res["line_index"]
-            del new_res["line"]
-            del new_res["offset"]
-            del new_res["re_finds"]
-            new_res["issues"] = {}
-            results[find["id"]] = new_res
-        if issue in results[find["id"]]["issues"]:
+from findings_io import iter_json_findings, write_json_items
+from stage_metrics import timed
+
+FIND_FIELDS = ("id", "line_index", "line", "offset", "re_finds")
+# the number of finds (not bytes) buffered before the email groups are spilled.
+SPILL_THRESHOLD = 200000
+
+
+def add_find(results: dict, issue: str, find: dict):
+    """Adds a find to the email it was found in."""
+    if find["id"] not in results:
+        # the meta data is only read, so it can be shared instead of copied.
+        new_res = {key: value for key, value in find.items() if key not in FIND_FIELDS}
+        new_res["issues"] = {}
+        results[find["id"]] = new_res
+    if issue in results[find["id"]]["issues"]:
+        return
+    results[find["id"]]["issues"][issue] = {
+        "line_index": find["line_index"],
+        "line": find["line"],
+        "offset": find["offset"],
+        "re_finds": find["re_finds"],
+    }
+
+
+def spill(entries: list, key):
+    """Writes ``[position, email id, group]`` entries to a temporary run, sorted."""
+    run = tempfile.TemporaryFile("w+", encoding="utf-8")
+    for entry in sorted(entries, key=key):
+        run.write(json.dumps(entry))
+        run.write("\n")
+    run.seek(0)
+    return run
+
+
+def by_email(entry: list):
+    return entry[1]
+
+
+def by_position(entry: list):
+    return entry[0]
+
+
+def iter_run(run):
+    """Yields the ``[position, email id, group]`` entries of a run."""
+    for line in run:
+        yield json.loads(line)
+
+
+def merge_runs(runs: list, key):
+    """Merges the sorted runs into one stream of entries."""
+    return heapq.merge(*(iter_run(run) for run in runs), key=key)
+
+
+def combine_emails(runs: list):
+    """
+    Merges the runs sorted by email id into one entry per email. Groups of the
+    same email are combined in run order, so the earliest find keeps providing
+    the meta data and its position, and issues keep their order.
+    """
+    current = None
+    for entry in merge_runs(runs, by_email):
+        if current is not None and entry[1] == current[1]:
+            for issue, reference in entry[2]["issues"].items():
+                if issue not in current[2]["issues"]:
+                    current[2]["issues"][issue] = reference
             continue
-        results[find["id"]]["issues"][issue] = {
-            "line_index": find["line_index"],
-            "line": find["line"],
-            "offset": find["offset"],
-            "re_finds": find["re_finds"],
-        }
+        if current is not None:
+            yield current
+        current = entry
+    if current is not None:
+        yield current
+
 
+@timed(items=lambda email_count, *_, **__: email_count)
+def restructure(
+    input_path: str, output_path: str, spill_threshold: int = SPILL_THRESHOLD
+) -> int:
+    """Restructures the issue-keyed findings json; returns the email count."""
+    positions = {}
+    results = {}
+    runs = []
+    buffered = 0
+    for position, (issue, find) in enumerate(iter_json_findings(input_path)):
+        positions.setdefault(find["id"], position)
+        add_find(results, issue, find)
+        buffered += 1
+        if buffered >= spill_threshold:
+            entries = [[positions[key], key, group] for key, group in results.items()]
+            runs.append(spill(entries, by_email))
+            positions = {}
+            results = {}
+            buffered = 0
+    if len(runs) == 0:
+        # everything fits, the groups are already in order of first appearance.
+        with open(output_path, "w", encoding="utf-8") as output_file:
+            write_json_items(output_file, results.items())
+        return len(results)
+    entries = [[positions[key], key, group] for key, group in results.items()]
+    runs.append(spill(entries, by_email))
+    del positions, results, entries
+    ordered_runs = []
+    buffer = []
+    buffered = 0
+    email_count = 0
+    for entry in combine_emails(runs):
+        buffer.append(entry)
+        buffered += len(entry[2]["issues"])
+        email_count += 1
+        if buffered >= spill_threshold:
+            ordered_runs.append(spill(buffer, by_position))
+            buffer = []
+            buffered = 0
+    ordered_runs.append(spill(buffer, by_position))
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        write_json_items(
+            output_file,
+            (
+                (email_id, group)
+                for _, email_id, group in merge_runs(ordered_runs, by_position)
+            ),
+        )
+    for run in runs + ordered_runs:
+        run.close()
+    return email_count
 
-print(f"email count = {len(results.keys())}")
 
-# OLD_OUTPUT_PATH = "./data/find_issues_in_text/reformatted_output.json"
+if __name__ == "__main__":
+    # OLD_INPUT_PATH = "./data/find_issues_in_text/the_output.json"
+    # OLD_OUTPUT_PATH = "./data/find_issues_in_text/reformatted_output.json"
 
-with open("./data/finder/res_findings.json", "w", encoding="utf-8") as output_file:
-    output_file.write(json.dumps(results, indent=4))
+    email_count = restructure(
+        "./data/finder/findings.json", "./data/finder/res_findings.json"
+    )
+    print(f"email count = {email_count}")
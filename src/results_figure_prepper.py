@@ -1,5 +1,9 @@
 import csv
 
+import numpy as np
+
+from tag_matrix import write_tag_matrix
+
 
 def load_dataset(data_path: str, interesting_tags: list) -> list:
     """sdf"""
@@ -16,7 +20,26 @@ def load_dataset(data_path: str, interesting_tags: list) -> list:
     return data
 
 
-def reformat(data_set: list, interesting_tags: list, output_path: str):
+def tag_rows(data_set: list, interesting_tags: list) -> list:
+    """Returns the ``(id, subject, [0/1 per interesting tag])`` row of every entry."""
+    return [
+        (
+            row["id"],
+            row["subject"],
+            [1 if tag in row["tags"] else 0 for tag in interesting_tags],
+        )
+        for row in data_set
+    ]
+
+
+def reformat(
+    data_set: list, interesting_tags: list, output_path: str, matrix_path: str = None
+):
+    """
+    Writes the tag rows as csv; with a ``matrix_path``, the tag columns are
+    also written as a binary tag matrix.
+    """
+    rows = tag_rows(data_set, interesting_tags)
     with open(output_path, "w", encoding="utf-8") as output_file:
         # Header string
         output_file.write("ID,Subject,")
@@ -24,20 +47,27 @@ def reformat(data_set: list, interesting_tags: list, output_path: str):
             output_file.write(f'"{tag}",')
         output_file.write("\n")
         # Content
-        for row in data_set:
-            subject = row["subject"].replace('"',"'")
-            output_file.write(f'\"{row["id"]}\",\"{subject}\",')
-            tgs = row["tags"]
-            for tag in interesting_tags:
-                if tag in tgs:
-                    output_file.write("1,")
-                else:
-                    output_file.write("0,")
+        for row_id, subject, values in rows:
+            subject = subject.replace('"',"'")
+            output_file.write(f'\"{row_id}\",\"{subject}\",')
+            for value in values:
+                output_file.write(f"{value},")
             output_file.write("\n")
+    if matrix_path is not None:
+        matrix = np.array([values for _, _, values in rows], dtype=np.uint8)
+        write_tag_matrix(
+            matrix_path,
+            matrix.reshape(len(rows), len(interesting_tags)),
+            interesting_tags,
+            ["ID"],
+            [(row_id,) for row_id, _, _ in rows],
+            2,
+        )
 
 
 DATA_PATH = "./data/data_prepper/the_data.csv"
 OUTPUT_PATH = "./data/data_prepper/the_export.csv"
+MATRIX_PATH = "./data/data_prepper/the_export.npy"
 INTERESTING_TAGS = [
     "Architecturally Irrelevant",
     "Release Group",
@@ -53,5 +83,6 @@ INTERESTING_TAGS = [
     # "Issue Reference"
 ]
 
-ds = load_dataset(DATA_PATH, INTERESTING_TAGS)
-reformat(ds, INTERESTING_TAGS, OUTPUT_PATH)
+if __name__ == "__main__":
+    ds = load_dataset(DATA_PATH, INTERESTING_TAGS)
+    reformat(ds, INTERESTING_TAGS, OUTPUT_PATH, MATRIX_PATH)
@@ -0,0 +1,127 @@
+"""
+Sidecar state of the issue finder, used for incremental and resumable runs.
+Per input file it keeps, for every message, the hash of its lines, the version
+of the issue vocabulary it was scanned with and the references that were found.
+Checkpoints of a running scan are appended to an NDJSON log next to the state,
+one line with the messages recorded since the previous checkpoint.
+"""
+
+import json
+import os
+from hashlib import blake2b
+
+CHECKPOINT_INTERVAL = 10000
+LOG_SUFFIX = ".log"
+
+
+def vocabulary_version(issues: list) -> str:
+    """Identifies an issue vocabulary."""
+    return blake2b("\n".join(issues).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def hash_lines(lines: list) -> str:
+    """Hashes the lines of a message."""
+    digest = blake2b(digest_size=12)
+    for line in lines:
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ScanState:
+    """
+    Persistent record of scanned messages.
+    Every ``CHECKPOINT_INTERVAL`` messages, the newly recorded messages are
+    appended to a log next to the state, so an interrupted run continues where
+    the last checkpoint left off without rewriting the whole state.
+    ``save`` compacts the log into the state file.
+    """
+
+    def __init__(self, state_path: str, issues: list):
+        self.state_path = state_path
+        self.log_path = f"{state_path}{LOG_SUFFIX}"
+        self.version = vocabulary_version(issues)
+        self.vocabularies = {}
+        self.files = {}
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as state_file:
+                state = json.loads(state_file.read())
+            self.vocabularies = state["vocabularies"]
+            self.files = state["files"]
+        self._replay_log()
+        self._seen = {}
+        self._pending = {"vocabularies": {}, "files": {}}
+        self._unsaved = 0
+        if self.version not in self.vocabularies:
+            self._pending["vocabularies"][self.version] = issues
+        self.vocabularies[self.version] = issues
+
+    def _replay_log(self):
+        """Applies the checkpoints of an interrupted run, one per log line."""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "r", encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    checkpoint = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last checkpoint may be incomplete when the run was killed.
+                    break
+                self.vocabularies.update(checkpoint["vocabularies"])
+                for file_path, messages in checkpoint["files"].items():
+                    self.files.setdefault(file_path, {}).update(messages)
+
+    def lookup(self, file_path: str, key: str):
+        """Returns ``[hash, version, hits]`` of a message, or None when it is unknown."""
+        return self.files.get(file_path, {}).get(key)
+
+    def record(self, file_path: str, key: str, message_hash: str, hits: list):
+        """Stores the references found in a message with the current vocabulary."""
+        value = [message_hash, self.version, hits]
+        self.files.setdefault(file_path, {})[key] = value
+        self._seen.setdefault(file_path, set()).add(key)
+        self._pending["files"].setdefault(file_path, {})[key] = value
+        self._unsaved += 1
+        if self._unsaved >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Appends the messages recorded since the last checkpoint to the log."""
+        if self._unsaved == 0:
+            return
+        with open(self.log_path, "a", encoding="utf-8") as log_file:
+            log_file.write(json.dumps(self._pending))
+            log_file.write("\n")
+        self._pending = {"vocabularies": {}, "files": {}}
+        self._unsaved = 0
+
+    def finish_file(self, file_path: str):
+        """Forgets the messages that are no longer part of a fully scanned file."""
+        seen = self._seen.pop(file_path, set())
+        messages = self.files.get(file_path, {})
+        self.files[file_path] = {
+            key: value for key, value in messages.items() if key in seen
+        }
+
+    def save(self):
+        """
+        Writes the whole state to disk, replacing the previous one atomically,
+        and removes the log of checkpoints.
+        """
+        used = {self.version}
+        for messages in self.files.values():
+            used.update(value[1] for value in messages.values())
+        self.vocabularies = {
+            version: issues
+            for version, issues in self.vocabularies.items()
+            if version in used
+        }
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as state_file:
+            state_file.write(
+                json.dumps({"vocabularies": self.vocabularies, "files": self.files})
+            )
+        os.replace(temp_path, self.state_path)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._pending = {"vocabularies": {}, "files": {}}
+        self._unsaved = 0
@@ -0,0 +1,214 @@
+"""
+Instrumentation of the main stages of the scripts: wall time, call count,
+processed items and peak memory (``tracemalloc``) per stage.
+
+Metrics are off by default and the instrumented functions then only pay for
+one flag check. They are switched on with ``collect(...)`` or by setting the
+``STAGE_METRICS_REPORT`` environment variable to the path of the json report;
+``STAGE_METRICS_PROFILE`` additionally dumps a cProfile of the run.
+Only the calling process is measured, not the workers of a process pool.
+Stages nest per thread; peak memory is traced for the whole process, so
+stages running in parallel threads see each other's allocations.
+"""
+
+import atexit
+import cProfile
+import json
+import multiprocessing
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+REPORT_ENV = "STAGE_METRICS_REPORT"
+PROFILE_ENV = "STAGE_METRICS_PROFILE"
+MEMORY_ENV = "STAGE_METRICS_MEMORY"
+
+_STATE = {"enabled": False, "memory": False}
+_METRICS = {}
+_METRICS_LOCK = threading.Lock()
+# stages are nested per thread, so every thread has its own stack of open stages.
+_LOCAL = threading.local()
+
+
+def _stack() -> list:
+    if not hasattr(_LOCAL, "stack"):
+        _LOCAL.stack = []
+    return _LOCAL.stack
+
+
+def is_enabled() -> bool:
+    return _STATE["enabled"]
+
+
+def enable(memory: bool = True):
+    """Starts recording; with ``memory``, peak memory is traced as well (slower)."""
+    _STATE["enabled"] = True
+    _STATE["memory"] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """Stops recording; the metrics recorded so far are kept."""
+    _STATE["enabled"] = False
+    if _STATE["memory"] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _STATE["memory"] = False
+
+
+def reset():
+    with _METRICS_LOCK:
+        _METRICS.clear()
+
+
+def metrics() -> dict:
+    """Returns the recorded metrics per stage."""
+    with _METRICS_LOCK:
+        return {name: dict(values) for name, values in _METRICS.items()}
+
+
+class Stage:
+    """
+    Records one run of a stage; used as a context manager.
+    Items processed inside the stage are counted with ``add_items``.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self._start = None
+        self._memory_start = 0
+        self._memory_peak = 0
+
+    def add_items(self, count: int):
+        self.items += count
+
+    def __enter__(self):
+        if not _STATE["enabled"]:
+            return self
+        stack = _stack()
+        if _STATE["memory"] and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if len(stack) > 0:
+                # the peak is reset for this stage, so the parent keeps what it had.
+                stack[-1]._memory_peak = max(stack[-1]._memory_peak, peak)
+            tracemalloc.reset_peak()
+            self._memory_start = current
+            self._memory_peak = current
+        stack.append(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        if self._start is None:
+            return False
+        seconds = time.perf_counter() - self._start
+        stack = _stack()
+        stack.pop()
+        peak = 0
+        if _STATE["memory"] and tracemalloc.is_tracing():
+            absolute_peak = max(self._memory_peak, tracemalloc.get_traced_memory()[1])
+            peak = absolute_peak - self._memory_start
+            if len(stack) > 0:
+                stack[-1]._memory_peak = max(stack[-1]._memory_peak, absolute_peak)
+        with _METRICS_LOCK:
+            record = _METRICS.setdefault(
+                self.name, {"calls": 0, "seconds": 0.0, "items": 0, "peak_bytes": 0}
+            )
+            record["calls"] += 1
+            record["seconds"] += seconds
+            record["items"] += self.items
+            record["peak_bytes"] = max(record["peak_bytes"], peak)
+        return False
+
+
+def stage(name: str) -> Stage:
+    """Context manager that records a block of code as a stage."""
+    return Stage(name)
+
+
+def timed(name: str = None, items=None):
+    """
+    Decorator that records every call of a function as a stage, named after
+    the function by default. ``items(result, *args, **kwargs)`` returns the
+    number of items a call processed.
+    """
+
+    def decorator(function):
+        stage_name = name if name is not None else function.__name__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _STATE["enabled"]:
+                return function(*args, **kwargs)
+            with Stage(stage_name) as current:
+                result = function(*args, **kwargs)
+                if items is not None:
+                    current.add_items(items(result, *args, **kwargs))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def write_report(report_path: str):
+    """Writes the recorded metrics, slowest stage first, as json."""
+    ordered = sorted(metrics().items(), key=lambda item: -item[1]["seconds"])
+    report = {
+        name: {
+            **values,
+            "items_per_second": (
+                values["items"] / values["seconds"] if values["seconds"] > 0 else None
+            ),
+        }
+        for name, values in ordered
+    }
+    with open(report_path, "w", encoding="utf-8") as report_file:
+        report_file.write(json.dumps({"stages": report}, indent=4))
+
+
+@contextmanager
+def collect(report_path: str, profile_path: str = None, memory: bool = True):
+    """
+    Records the stages run inside the block and writes the report afterwards;
+    with a ``profile_path``, the block is also profiled with cProfile.
+    """
+    profiler = cProfile.Profile() if profile_path is not None else None
+    enable(memory)
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        disable()
+        write_report(report_path)
+
+
+def _collect_from_environment():
+    """Records the whole run when the report path is set in the environment."""
+    report_path = os.environ.get(REPORT_ENV)
+    if report_path is None or report_path == "":
+        return
+    # worker processes import the scripts too, but must not overwrite the report.
+    if multiprocessing.parent_process() is not None:
+        return
+    collection = collect(
+        report_path,
+        os.environ.get(PROFILE_ENV) or None,
+        os.environ.get(MEMORY_ENV, "1") != "0",
+    )
+    collection.__enter__()
+    atexit.register(collection.__exit__, None, None, None)
+
+
+# forked workers run the instrumented functions too, but aren't measured.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=disable)
+_collect_from_environment()
@@ -0,0 +1,100 @@
+"""
+Binary 0/1 tag matrices, an alternative to the tag columns of the csv exports.
+The matrix is stored as a uint8 ``.npy`` file that can be memory-mapped, next
+to a json sidecar with the tag names, the ids of the rows and the number of
+meta data columns that precede the tags in the csv, so csv column indices
+can be used on the matrix as they are.
+"""
+
+import json
+import os
+
+import numpy as np
+
+MATRIX_SUFFIX = ".npy"
+SIDECAR_SUFFIX = ".json"
+
+
+def matrix_path_for(csv_path: str) -> str:
+    """The path of the binary matrix written next to a csv export."""
+    return f"{os.path.splitext(csv_path)[0]}{MATRIX_SUFFIX}"
+
+
+def sidecar_path(matrix_path: str) -> str:
+    return f"{matrix_path}{SIDECAR_SUFFIX}"
+
+
+def is_tag_matrix(data_path: str) -> bool:
+    return data_path.endswith(MATRIX_SUFFIX)
+
+
+def build_tag_matrix(tag_sets: list, columns: list) -> np.ndarray:
+    """Builds the uint8 matrix of which columns are in the tag set of every row."""
+    column_index = {column: index for index, column in enumerate(columns)}
+    rows = []
+    cols = []
+    for row, tags in enumerate(tag_sets):
+        for tag in tags:
+            if tag in column_index:
+                rows.append(row)
+                cols.append(column_index[tag])
+    matrix = np.zeros((len(tag_sets), len(columns)), dtype=np.uint8)
+    matrix[rows, cols] = 1
+    return matrix
+
+
+def write_tag_matrix(
+    matrix_path: str,
+    matrix: np.ndarray,
+    columns: list,
+    row_fields: list,
+    rows: list,
+    column_offset: int,
+):
+    """
+    Writes the matrix and its sidecar. ``rows`` holds the ``row_fields`` ids
+    of every row, ``column_offset`` is the number of meta data columns in the
+    matching csv.
+    """
+    if matrix.shape != (len(rows), len(columns)):
+        raise ValueError("The matrix doesn't match the rows and columns.")
+    sidecar = {
+        "columns": list(columns),
+        "column_offset": column_offset,
+        "row_fields": list(row_fields),
+        "rows": [list(row) for row in rows],
+    }
+    temp_path = f"{matrix_path}.tmp"
+    with open(temp_path, "wb") as matrix_file:
+        np.save(matrix_file, np.ascontiguousarray(matrix, dtype=np.uint8))
+    os.replace(temp_path, matrix_path)
+    temp_path = f"{sidecar_path(matrix_path)}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as sidecar_file:
+        sidecar_file.write(json.dumps(sidecar))
+    os.replace(temp_path, sidecar_path(matrix_path))
+
+
+def load_tag_matrix_file(matrix_path: str) -> tuple:
+    """Returns the sidecar and the read-only, memory-mapped matrix."""
+    with open(sidecar_path(matrix_path), "r", encoding="utf-8") as sidecar_file:
+        sidecar = json.loads(sidecar_file.read())
+    matrix = np.load(matrix_path, mmap_mode="r")
+    if matrix.shape[1] != len(sidecar["columns"]):
+        raise ValueError("The matrix doesn't match its sidecar.")
+    return sidecar, matrix
+
+
+def matrix_header(sidecar: dict) -> list:
+    """The csv header of the matrix; the meta data columns are unnamed."""
+    return [""] * sidecar["column_offset"] + sidecar["columns"]
+
+
+def matrix_columns(sidecar: dict, matrix: np.ndarray, columns: list) -> np.ndarray:
+    """Reads csv columns of the matrix into an integer matrix."""
+    offset = sidecar["column_offset"]
+    if any(column < offset for column in columns):
+        raise ValueError("Only tag columns are stored in the matrix.")
+    selected = matrix[:, [column - offset for column in columns]].astype(np.int64)
+    if np.any(selected > 1):
+        raise ValueError("Tag columns may only contain 0 and 1.")
+    return selected
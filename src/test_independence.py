@@ -1,22 +1,61 @@
 import csv
-from scipy.stats import fisher_exact
+import heapq
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
+from scipy import sparse
 
-def calculate_co_occurrence(data: list, subject: int, outcome: int) -> float:
+from contingency_tests import FisherEngine, independence_tests
+from stage_metrics import timed
+from tag_matrix import (
+    is_tag_matrix,
+    load_tag_matrix_file,
+    matrix_columns,
+    matrix_header,
+)
+
+FISHER = FisherEngine()
+
+
+def load_tag_matrix(data: list, columns: list) -> np.ndarray:
+    """Converts the columns of the csv rows (without header) to an integer matrix."""
+    if len(data) <= 1:
+        return np.zeros((0, len(columns)), dtype=np.int64)
+    matrix = np.array(
+        [[entry[column].strip() for column in columns] for entry in data[1:]]
+    ).astype(np.int64)
+    if np.any((matrix != 0) & (matrix != 1)):
+        raise ValueError("Tag columns may only contain 0 and 1.")
+    return matrix
+
+
+def contingency_tables(subjects: np.ndarray, outcomes: np.ndarray) -> np.ndarray:
+    """
+    Calculates the contingency table of every (subject, outcome) column pair
+    with one matrix product. Returns an array of shape (subjects, outcomes, 2, 2).
+    """
     # Contingency Format:
     #     YS, NS
     # NO [[a, b],
     # YO  [c, d]]
-    contingency = [[0, 0], [0, 0]]
-    for entry in data[1:]:
-        col = 0 if int(entry[subject]) == 1 else 1
-        row = int(entry[outcome])
-        contingency[row][col] += 1
+    both = subjects.T @ outcomes
+    only_subject = subjects.sum(axis=0)[:, None] - both
+    only_outcome = outcomes.sum(axis=0)[None, :] - both
+    neither = subjects.shape[0] - both - only_subject - only_outcome
+    tables = np.empty(both.shape + (2, 2), dtype=np.int64)
+    tables[..., 0, 0] = only_subject
+    tables[..., 0, 1] = neither
+    tables[..., 1, 0] = both
+    tables[..., 1, 1] = only_outcome
+    return tables
+
 
+def calculate_co_occurrence(data: list, subject: int, outcome: int) -> tuple:
+    """Tests the subject and outcome columns of the csv rows (with header)."""
+    matrix = load_tag_matrix(data, [subject, outcome])
+    contingency = contingency_tables(matrix[:, :1], matrix[:, 1:])[0, 0].tolist()
     # Stats: whether its: 1) sig. lower, 2) sig. greater, 3) sig. different.
-    _, lower_p = fisher_exact(contingency, alternative="less")
-    _, greater_p = fisher_exact(contingency, alternative="greater")
-    _, two_tailed_p = fisher_exact(contingency, alternative="two-sided")
+    lower_p, greater_p, two_tailed_p = FISHER.test(contingency)
     return (
         data[0][subject],
         data[0][outcome],
@@ -27,41 +66,314 @@ def calculate_co_occurrence(data: list, subject: int, outcome: int) -> float:
     )
 
 
-def calculate(data_path: str, row_indices: list, col_indices: list) -> list:
-    results = [None] * len(row_indices)
+def load_columns(data_path: str, row_indices: list, col_indices: list) -> tuple:
+    """
+    Reads the csv once and returns its header and the 0/1 matrices of the
+    row and column indices. A binary tag matrix (``.npy``) is memory-mapped
+    instead, so only the requested columns are read.
+    """
+    if is_tag_matrix(data_path):
+        sidecar, matrix = load_tag_matrix_file(data_path)
+        return (
+            matrix_header(sidecar),
+            matrix_columns(sidecar, matrix, row_indices),
+            matrix_columns(sidecar, matrix, col_indices),
+        )
     with open(data_path, "r", encoding="utf-8") as data_file:
         data: list = list(csv.reader(data_file, delimiter=",", quotechar='"'))
-        for i, rix in enumerate(row_indices):
-            results[i] = [None] * len(col_indices)
-            for j, cix in enumerate(col_indices):
-                results[i][j] = calculate_co_occurrence(data, rix, cix)
+    columns = sorted(set(row_indices) | set(col_indices))
+    position = {column: index for index, column in enumerate(columns)}
+    matrix = load_tag_matrix(data, columns)
+    return (
+        data[0],
+        matrix[:, [position[rix] for rix in row_indices]],
+        matrix[:, [position[cix] for cix in col_indices]],
+    )
+
+
+@timed(items=lambda results, *_: sum(map(len, results)))
+def calculate(data_path: str, row_indices: list, col_indices: list) -> list:
+    """
+    Tests every pair of row and column indices. The csv is converted to a 0/1
+    matrix once, all contingency tables come from a single matrix product and
+    are tested in one batch.
+    """
+    row_indices = list(row_indices)
+    col_indices = list(col_indices)
+    header, subjects, outcomes = load_columns(data_path, row_indices, col_indices)
+    return test_pairs(
+        [header[rix] for rix in row_indices],
+        [header[cix] for cix in col_indices],
+        subjects,
+        outcomes,
+    )
+
+
+def test_pairs(
+    subject_names: list, outcome_names: list, subjects: np.ndarray, outcomes: np.ndarray
+) -> list:
+    """
+    Tests every pair of subject and outcome columns of two 0/1 matrices
+    with the same rows; the results are laid out like those of ``calculate``.
+    """
+    tables = contingency_tables(subjects, outcomes)
+    # Stats: whether its: 1) sig. lower, 2) sig. greater, 3) sig. different.
+    p_values = FISHER.test_batch(tables.reshape(-1, 2, 2)).reshape(
+        len(subject_names), len(outcome_names), 3
+    )
+    tables = tables.tolist()
+    p_values = p_values.tolist()
+    results = [None] * len(subject_names)
+    for i, subject in enumerate(subject_names):
+        results[i] = [None] * len(outcome_names)
+        for j, outcome in enumerate(outcome_names):
+            results[i][j] = (subject, outcome, tables[i][j], *p_values[i][j])
     return results
 
 
+@timed(items=lambda results, *_: sum(map(len, results)))
+def calculate_chi2(data_path: str, row_indices: list, col_indices: list) -> list:
+    """
+    Chi-square tests every pair of row and column indices in one batch.
+    Pairs whose table has an expected count below 5 get the Fisher exact p instead.
+    Entries are (subject, outcome, contingency, chi2, chi2 p, p, test).
+    """
+    row_indices = list(row_indices)
+    col_indices = list(col_indices)
+    header, subjects, outcomes = load_columns(data_path, row_indices, col_indices)
+    tables = contingency_tables(subjects, outcomes)
+    tests = independence_tests(tables.reshape(-1, 2, 2), FISHER)
+    shape = (len(row_indices), len(col_indices))
+    statistics = tests["statistic"].reshape(shape).tolist()
+    chi2_p = tests["chi2_p"].reshape(shape).tolist()
+    p_values = tests["p"].reshape(shape).tolist()
+    use_fisher = tests["fisher"].reshape(shape).tolist()
+    tables = tables.tolist()
+    results = [None] * len(row_indices)
+    for i, rix in enumerate(row_indices):
+        results[i] = [None] * len(col_indices)
+        for j, cix in enumerate(col_indices):
+            results[i][j] = (
+                header[rix],
+                header[cix],
+                tables[i][j],
+                statistics[i][j],
+                chi2_p[i][j],
+                p_values[i][j],
+                "fisher" if use_fisher[i][j] else "chi2",
+            )
+    return results
+
+
+def calculate_cross(data_path: str, row_indices: list, col_indices: list) -> dict:
+    """
+    Builds the r x c table of how often each row category co-occurs with each
+    column category, e.g. decision types against rationale types, and tests it
+    with the chi-square test. With multi-valued categories a row can count in
+    several cells.
+    """
+    row_indices = list(row_indices)
+    col_indices = list(col_indices)
+    header, subjects, outcomes = load_columns(data_path, row_indices, col_indices)
+    table = subjects.T @ outcomes
+    tests = independence_tests(table[None, :, :], FISHER)
+    return {
+        "rows": [header[rix] for rix in row_indices],
+        "columns": [header[cix] for cix in col_indices],
+        "table": table.tolist(),
+        "statistic": float(tests["statistic"][0]),
+        "dof": tests["dof"],
+        "p": float(tests["p"][0]),
+        "low_expected": bool(tests["low_expected"][0]),
+    }
+
+
+EXPORT_HEADER = '"Subject","Outcome","Only Sub","Neither","Both","Only Out","Fisher Lower p","Fisher Greater p","Fisher Two-tailed p",\n'
+
+
+def write_result(output_file, col: tuple):
+    """Writes one tested pair as an export row."""
+    output_file.write(f'"{col[0]}","{col[1]}",')
+    for r2 in col[2]:
+        for c2 in r2:
+            output_file.write(f'"{c2}",')
+    for ele in col[3:]:
+        output_file.write(f'"{ele}",')
+    output_file.write("\n")
+
+
+@timed(items=lambda _, results, *__: sum(map(len, results)))
 def export(results: list, output_path: str):
     with open(output_path, "w+", encoding="utf-8") as output_file:
-        output_file.write(
-            '"Subject","Outcome","Only Sub","Neither","Both","Only Out","Fisher Lower p","Fisher Greater p","Fisher Two-tailed p",\n'
-        )
+        output_file.write(EXPORT_HEADER)
         for row in results:
             for col in row:
-                output_file.write(f'"{col[0]}","{col[1]}",')
-                for r2 in col[2]:
-                    for c2 in r2:
-                        output_file.write(f'"{c2}",')
-                for ele in col[3:]:
-                    output_file.write(f'"{ele}",')
-                output_file.write("\n")
+                write_result(output_file, col)
+
+
+CHI2_EXPORT_HEADER = '"Subject","Outcome","Only Sub","Neither","Both","Only Out","Chi2","Chi2 p","p","Test",\n'
+
+
+@timed(items=lambda _, results, *__: sum(map(len, results)))
+def export_chi2(results: list, output_path: str):
+    """Exports the results of ``calculate_chi2``."""
+    with open(output_path, "w+", encoding="utf-8") as output_file:
+        output_file.write(CHI2_EXPORT_HEADER)
+        for row in results:
+            for col in row:
+                write_result(output_file, col)
+
+
+def load_sparse_tag_matrix(data_path: str, columns: list) -> tuple:
+    """
+    Reads the columns of the csv into a sparse boolean matrix (rows x columns),
+    one csv row at a time. Returns the header and the matrix.
+    A binary tag matrix (``.npy``) is memory-mapped instead.
+    """
+    if is_tag_matrix(data_path):
+        sidecar, matrix = load_tag_matrix_file(data_path)
+        columns = matrix_columns(sidecar, matrix, columns)
+        return matrix_header(sidecar), sparse.csc_matrix(columns.astype(bool))
+    header = None
+    row_ids = []
+    column_ids = []
+    row_count = 0
+    with open(data_path, "r", encoding="utf-8") as data_file:
+        for entry in csv.reader(data_file, delimiter=",", quotechar='"'):
+            if header is None:
+                header = entry
+                continue
+            for position, column in enumerate(columns):
+                value = entry[column].strip()
+                if value == "1":
+                    row_ids.append(row_count)
+                    column_ids.append(position)
+                elif value != "0":
+                    raise ValueError("Tag columns may only contain 0 and 1.")
+            row_count += 1
+    matrix = sparse.csc_matrix(
+        (np.ones(len(row_ids), dtype=bool), (row_ids, column_ids)),
+        shape=(row_count, len(columns)),
+    )
+    return header, matrix
+
+
+_SPARSE_STATE = {}
+
+
+def _init_sparse_worker(state: dict):
+    """Keeps the matrices and settings of a sparse run in the worker process."""
+    _SPARSE_STATE.update(state)
+
+
+def _test_sparse_chunk(start: int, end: int) -> list:
+    """Tests the subject columns ``start:end`` against all outcome columns."""
+    state = _SPARSE_STATE
+    subjects = state["subjects"][:, start:end]
+    both = (subjects.T.astype(np.int64) @ state["outcomes"].astype(np.int64)).toarray()
+    only_subject = state["subject_totals"][start:end, None] - both
+    only_outcome = state["outcome_totals"][None, :] - both
+    neither = state["row_count"] - both - only_subject - only_outcome
+    tables = np.stack([only_subject, neither, both, only_outcome], axis=-1)
+    p_values = FISHER.test_batch(tables.reshape(-1, 2, 2)).reshape(
+        both.shape + (3,)
+    )
+    keep = np.ones(both.shape, dtype=bool)
+    if state["p_threshold"] is not None:
+        keep &= p_values[..., 2] < state["p_threshold"]
+    results = [
+        (
+            state["subject_names"][start + i],
+            state["outcome_names"][j],
+            tables[i, j].reshape(2, 2).tolist(),
+            *p_values[i, j].tolist(),
+        )
+        for i, j in zip(*np.nonzero(keep))
+    ]
+    if state["top_k"] is not None:
+        results = heapq.nsmallest(state["top_k"], results, key=lambda col: col[5])
+    return results
+
+
+def calculate_sparse(
+    data_path: str,
+    row_indices: list,
+    col_indices: list,
+    output_path: str,
+    p_threshold: float = 0.05,
+    top_k: int = None,
+    workers: int = 1,
+    chunk_size: int = 64,
+) -> int:
+    """
+    Tests every pair of row and column indices for very wide tag sets.
+    The tags are kept in a sparse boolean matrix and the subject columns are
+    tested in chunks, in a process pool when there is more than one worker.
+    Only pairs with a two-tailed p below the threshold are exported, streamed
+    as chunks finish; with ``top_k``, only the k most significant of those,
+    ordered by p. Returns the number of exported pairs.
+    """
+    row_indices = list(row_indices)
+    col_indices = list(col_indices)
+    columns = sorted(set(row_indices) | set(col_indices))
+    position = {column: index for index, column in enumerate(columns)}
+    header, matrix = load_sparse_tag_matrix(data_path, columns)
+    subjects = matrix[:, [position[rix] for rix in row_indices]]
+    outcomes = matrix[:, [position[cix] for cix in col_indices]]
+    state = {
+        "subjects": subjects,
+        "outcomes": outcomes,
+        "subject_totals": np.asarray(subjects.sum(axis=0)).reshape(-1),
+        "outcome_totals": np.asarray(outcomes.sum(axis=0)).reshape(-1),
+        "row_count": subjects.shape[0],
+        "subject_names": [header[rix] for rix in row_indices],
+        "outcome_names": [header[cix] for cix in col_indices],
+        "p_threshold": p_threshold,
+        "top_k": top_k,
+    }
+    chunks = range(0, len(row_indices), chunk_size)
+    chunk_ends = [min(start + chunk_size, len(row_indices)) for start in chunks]
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            workers, initializer=_init_sparse_worker, initargs=(state,)
+        )
+        chunk_results = pool.map(_test_sparse_chunk, chunks, chunk_ends)
+    else:
+        _init_sparse_worker(state)
+        chunk_results = map(_test_sparse_chunk, chunks, chunk_ends)
+    exported = 0
+    best = []
+    try:
+        with open(output_path, "w+", encoding="utf-8") as output_file:
+            output_file.write(EXPORT_HEADER)
+            for results in chunk_results:
+                if top_k is not None:
+                    best = heapq.nsmallest(top_k, best + results, key=lambda col: col[5])
+                    continue
+                for col in results:
+                    write_result(output_file, col)
+                exported += len(results)
+            for col in best:
+                write_result(output_file, col)
+            exported += len(best)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return exported
 
 
 if __name__ == "__main__":
 
     DATA_PATH = "./data/the_best_exported_data/export_emails.csv"
     OUTPUT_PATH = "./data/the_best_exported_data/dec_vs_rat_emails.csv"
+    OUTPUT_PATH2 = "./data/the_best_exported_data/dec_vs_rat_emails_chi2.csv"
     OUTPUT_PATH3 = "./data/the_best_exported_data/rat_vs_rat_emails.csv"
 
     # Rationale vs Decision per Email
     export(calculate(DATA_PATH, range(3, 8), range(8, 17)), OUTPUT_PATH)
+    export_chi2(calculate_chi2(DATA_PATH, range(3, 8), range(8, 17)), OUTPUT_PATH2)
+    print(calculate_cross(DATA_PATH, range(3, 8), range(8, 17)))
 
     # Rationale vs Rationale per email
     export(calculate(DATA_PATH, range(8, 17), range(8, 17)), OUTPUT_PATH3)
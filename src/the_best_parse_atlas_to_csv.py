@@ -9,197 +9,420 @@ Two files are exported on two granularity levels:
 """
 
 import os
-from zipfile import ZipFile
 import xml.etree.ElementTree as ET
 from xml.etree.ElementTree import Element
 from copy import deepcopy
 import itertools
+from bisect import bisect_left, bisect_right
 import re
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 
-def load_atlas_as_tree(atlas_project_path: str, atlas_output_path: str) -> ET.Element:
-    """Loads the atlas project as an ET tree."""
-    with ZipFile(atlas_project_path, "r") as atlas_zip:
-        atlas_zip.extractall(atlas_output_path)
-    tree = ET.parse(os.path.join(atlas_output_path, "project.aprx"))
-    root = tree.getroot()
-    return root
+from atlas_contents import document_content_id, open_atlas_contents
+from atlas_document_cache import DocumentCache, document_key
+from stage_metrics import timed
+from tag_matrix import build_tag_matrix, matrix_path_for, write_tag_matrix
 
+COMMENT_BREAK = re.compile(r"<br id=\".\">")
+COMMENT_CACHE_SIZE = 1024
 
-# Load all quotes
-def load_all_quotes(root: Element) -> dict:
-    """Loads all quotes contained in the atlas project."""
-    quotes = {}
-    tags = {tg.get("id"): tg.get("name") for tg in root.find("tags").findall("tag")}
+
+@timed(items=lambda index, *_: len(index["quotes"]))
+def load_atlas_index(contents) -> dict:
+    """
+    Loads what the export needs from ``project.aprx`` in one streaming pass,
+    dropping every element once it is read, so the tree is never held in memory.
+    Returns the indexes ``tags`` (tag id to name), ``links`` (quote id to
+    tag names), ``quotes`` (document id to its sorted quotes) and ``contents``
+    (content id to location).
+    """
+    tags = {}
+    links = []
+    documents = {}
+    cnt_to_doc = {}
+    stack = []
+    layers = 0
+    with contents.open_project() as project_file:
+        for event, ele in ET.iterparse(project_file, events=("start", "end")):
+            if event == "start":
+                stack.append(ele)
+                path = [parent.tag for parent in stack[1:]]
+                if path == ["documents", "document"]:
+                    documents[ele.get("id")] = (ele.get("name"), [])
+                    layers = 0
+                elif path == ["documents", "document", "layer"]:
+                    layers += 1
+                continue
+            stack.pop()
+            path = [parent.tag for parent in stack[1:]] + [ele.tag]
+            if path == ["tags", "tag"]:
+                tags[ele.get("id")] = ele.get("name")
+            elif path == ["links", "tagQuotLink"]:
+                links.append((ele.get("source"), ele.get("target")))
+            elif path == ["contents", "content"]:
+                cnt_to_doc[ele.get("id")] = ele.get("loc")
+            elif path == ["documents", "document", "layer", "quotation"]:
+                # only the first layer of a document holds its quotations.
+                if layers == 1:
+                    documents[stack[2].get("id")][1].append(read_quotation(ele))
+            # the parts of a quotation are read when the quotation ends.
+            if "quotation" in path[:-1] or len(stack) == 0:
+                continue
+            # every other finished element is dropped, whatever section it is in.
+            stack[-1].remove(ele)
+    # links can precede the tags, so they are resolved once everything is read.
     quote_tags = {}
-    for tql in root.find("links").findall("tagQuotLink"):
-        trg = tql.get("target")
-        src = tags[tql.get("source")]
-        if trg in quote_tags:
-            quote_tags[trg].append(src)
+    for source, target in links:
+        if target in quote_tags:
+            quote_tags[target].append(tags[source])
         else:
-            quote_tags[trg] = [src]
-    # load quotations per document (unique id-to-segmentindices)
-    for doc in root.find("documents").findall("document"):
-        doc_id = doc.get("id")
+            quote_tags[target] = [tags[source]]
+    return {
+        "tags": tags,
+        "links": quote_tags,
+        "quotes": load_all_quotes(documents, quote_tags),
+        "contents": cnt_to_doc,
+    }
+
+
+def read_quotation(qt: Element) -> tuple:
+    """Reads the id, text location and comment of a quotation element."""
+    comment_obj = qt.find("comment")
+    comment_id = comment_obj.get("content") if comment_obj is not None else None
+    tloc = qt.find("location").find("segmentedTextLoc")
+    return (
+        qt.get("id"),
+        int(tloc.get("sSegment")),
+        int(tloc.get("sOffset")),
+        int(tloc.get("eSegment")),
+        int(tloc.get("eOffset")),
+        comment_id,
+    )
+
+
+# Load all quotes
+@timed(items=lambda quotes, *_: sum(map(len, quotes.values())))
+def load_all_quotes(documents: dict, quote_tags: dict) -> dict:
+    """Combines the quotations of every document with their tags."""
+    quotes = {}
+    for doc_id, (doc_name, quotations) in documents.items():
         quotes[doc_id] = []
-        for qt in doc.find("layer").findall("quotation"):
+        for qid, s_segment, s_offset, e_segment, e_offset, comment_id in quotations:
             try:
-                comment_obj = qt.find("comment")
-                comment_id = (
-                    comment_obj.get("content") if comment_obj is not None else None
-                )
-                tloc = qt.find("location").find("segmentedTextLoc")
                 qt_entry = {
-                    "thread": doc.get("name"),
-                    "id": qt.get("id"),
-                    "sSegment": int(tloc.get("sSegment")),
-                    "sOffset": int(tloc.get("sOffset")),
-                    "eSegment": int(tloc.get("eSegment")),
-                    "eOffset": int(tloc.get("eOffset")),
-                    #           - and apply the results from a and b on it.
-                    "tags": quote_tags[qt.get("id")],
+                    "thread": doc_name,
+                    "id": qid,
+                    "sSegment": s_segment,
+                    "sOffset": s_offset,
+                    "eSegment": e_segment,
+                    "eOffset": e_offset,
+                    "tags": quote_tags[qid],
                     "comment_content_id": comment_id,
                 }
                 quotes[doc_id].append(qt_entry)
-                if qt_entry["sSegment"] != qt_entry["eSegment"]:
-                    print(f'{qt_entry["sSegment"]=}, {qt_entry["eSegment"]=}')
             except KeyError:
-                qid = qt.get("id")
                 print(f"Failed on {qid}")
         quotes[doc_id].sort(key=lambda x: x["sSegment"])
     #       d. now we have {doc_id: [{quote_id, segmentindices, tags}]}
     return quotes
 
 
+@timed()
+def load_comment(cnt_to_doc: dict, comment_content_id: str, contents) -> str:
+    """
+    Loads the text stored in te atlasti comment.
+    The line breaks are blanked out in memory; the content file is left untouched.
+    """
+    comment_loc = cnt_to_doc[comment_content_id]
+    # print(f"{comment_loc=}")
+    data = contents.read_content(comment_loc).decode("utf-8")
+    data = COMMENT_BREAK.sub(lambda br: " " * len(br.group()), data)
+    comment_root = ET.fromstring(data)
+    return "".join(
+        f"\n{line.text}" for line in comment_root.find("body").find("p").findall("span")
+    )
+
+
+class CommentLoader:
+    """Loads comments through an LRU cache, as quotes often share a comment."""
+
+    def __init__(
+        self, cnt_to_doc: dict, contents, cache_size: int = COMMENT_CACHE_SIZE
+    ):
+        self._cnt_to_doc = cnt_to_doc
+        self._contents = contents
+        self.load = lru_cache(maxsize=cache_size)(self._load_uncached)
+
+    def _load_uncached(self, comment_content_id: str) -> str:
+        return load_comment(self._cnt_to_doc, comment_content_id, self._contents)
+
+
+class SegmentIndex:
+    """
+    Indexes the quotes of a document by their segment interval, so the quotes
+    starting at a segment are found by bisection.
+    """
+
+    def __init__(self, quotes: list):
+        self.quotes = sorted(quotes, key=lambda x: x["sSegment"])
+        self._starts = [quote["sSegment"] for quote in self.quotes]
+
+    def starting_at(self, segment: int) -> list:
+        """Returns the quotes starting at the segment, in quote order."""
+        first = bisect_left(self._starts, segment)
+        last = bisect_right(self._starts, segment, first)
+        return self.quotes[first:last]
+
+
+def segment_text(quote: dict, segment: int, text: str) -> str:
+    """Returns the part of a segment's text covered by the quote."""
+    start = quote["sOffset"] if segment == quote["sSegment"] else 0
+    end = quote["eOffset"] if segment == quote["eSegment"] else len(text)
+    return text[start:end]
+
+
+def header_segments(elements) -> set:
+    """
+    Returns the segments of the email headings and of their meta data lines
+    (labels and values), which aren't part of an email's text.
+    """
+    headers = set()
+    # labels whose value is still to come, in the order values are assigned.
+    waiting = {"email id:": False, "subject:": False, "tags:": False}
+    for ele in elements:
+        l_text = ele.find("span").text.lower()
+        label = next((label for label in waiting if l_text.startswith(label)), None)
+        is_header = ele.tag == "h2"
+        if label is not None:
+            waiting[label] = True
+            is_header = True
+        else:
+            value_of = next((label for label, wait in waiting.items() if wait), None)
+            if value_of is not None:
+                waiting[value_of] = False
+                is_header = True
+        if is_header:
+            headers.add(int(ele.get("id")) + 1)
+    return headers
+
+
 # generate data
-def generate_data(root: Element, quotes: dict) -> list:
-    """Generates data to export acquired from the atlas project."""
-    cnt_to_doc = {
-        cnt.get("id"): cnt.get("loc")
-        for cnt in root.find("contents").findall("content")
-    }
-    tags_per_email: dict[str, list] = {doc_id: [] for doc_id in quotes.keys()}
-    tags_per_quote = {doc_id: [] for doc_id in quotes.keys()}
-    for doc_id, quotes in quotes.items():
-        # Open respective HTML document with XML parser.
-        doc_loc = cnt_to_doc[f"cnt_{doc_id[4:]}"]
-        # print(f"{doc_loc=}")
-        doc_file = f"{ATLAS_PATH_OUT}contents/{doc_loc}/content"
-        parser = ET.XMLParser()
-        parser.entity["nbsp"] = " "
+def generate_document(
+    doc_id: str, quotes: list, cnt_to_doc: dict, contents, comments: CommentLoader
+) -> tuple:
+    """
+    Generates the email and quote entries of one atlas document.
+    The body is swept once; quotes spanning several segments are joined
+    with newlines. Quotes that only cover header segments are skipped.
+    """
+    tags_per_email = []
+    tags_per_quote = []
+    # Open respective HTML document with XML parser.
+    doc_loc = cnt_to_doc[document_content_id(doc_id)]
+    # print(f"{doc_loc=}")
+    parser = ET.XMLParser()
+    parser.entity["nbsp"] = " "
+    with contents.open_content(doc_loc) as doc_file:
         d_root = ET.parse(doc_file, parser=parser).getroot()
-        # data and flags
-        current_email = {
-            "document": doc_id,
-            "id": None,
-            "subject": None,
-            "type_tags": None,
-            "rationale_tags": set(),
-        }
-        quote_index = 0
-        email_id_flag = False
-        email_subject_flag = False
-        email_tags_flag = False
-        for ele in iter(d_root.find("body")):
-            # Stores all email entries their decision types and their rationale types.
-            if ele.tag == "h2" and current_email["id"] is not None:
-                tags_per_email[doc_id].append(deepcopy(current_email))
-                current_email["id"] = None
-                current_email["subject"] = None
-                current_email["type_tags"] = None
-                current_email["rationale_tags"] = set()
-            # Sets email information.
-            text = ele.find("span").text
-            l_text = text.lower()
-            if l_text.startswith("email id:"):
-                email_id_flag = True
-                continue
-            elif l_text.startswith("subject:"):
-                email_subject_flag = True
-                continue
-            elif l_text.startswith("tags:"):
-                email_tags_flag = True
-                continue
-            elif email_id_flag:
-                email_id_flag = False
-                current_email["id"] = text
-                continue
-            elif email_subject_flag:
-                email_subject_flag = False
-                current_email["subject"] = text
-                continue
-            elif email_tags_flag:
-                email_tags_flag = False
-                current_email["type_tags"] = text.strip().split(", ")
-                continue
-            # updating quotes cannot be done when the last one is handled.
-            if quote_index >= len(quotes):
-                continue
-            # handles all quotes
-            current_quote = quotes[quote_index]
-            eid = int(ele.get("id")) + 1
-            while eid == current_quote["sSegment"]:
-                quotation = text[current_quote["sOffset"] : current_quote["eOffset"]]
-                quote_tags = current_quote["tags"]
-                quote_id = current_quote["id"]
-                # updates current email
-                current_email["rationale_tags"].update(quote_tags)
-                # exports quotation.
-                new_entry = {
-                    "quote_id": quote_id,
-                    "quote": quotation,
-                    "tags": quote_tags,
-                    "email_id": current_email["id"],
-                    "email_subject": current_email["subject"],
-                    "comment": "",
-                    "email_tags": deepcopy(current_email["type_tags"]),
-                }
+    # data and flags
+    current_email = {
+        "document": doc_id,
+        "id": None,
+        "subject": None,
+        "type_tags": None,
+        "rationale_tags": set(),
+    }
+    body = list(d_root.find("body"))
+    headers = header_segments(body)
+    quote_index = SegmentIndex(
+        [
+            quote
+            for quote in quotes
+            if not all(
+                segment in headers
+                for segment in range(quote["sSegment"], quote["eSegment"] + 1)
+            )
+        ]
+    )
+    open_quotes = []
+    email_id_flag = False
+    email_subject_flag = False
+    email_tags_flag = False
+    for ele in body:
+        # Stores all email entries their decision types and their rationale types.
+        if ele.tag == "h2" and current_email["id"] is not None:
+            tags_per_email.append(deepcopy(current_email))
+            current_email["id"] = None
+            current_email["subject"] = None
+            current_email["type_tags"] = None
+            current_email["rationale_tags"] = set()
+        # Sets email information.
+        text = ele.find("span").text
+        l_text = text.lower()
+        if l_text.startswith("email id:"):
+            email_id_flag = True
+        elif l_text.startswith("subject:"):
+            email_subject_flag = True
+        elif l_text.startswith("tags:"):
+            email_tags_flag = True
+        elif email_id_flag:
+            email_id_flag = False
+            current_email["id"] = text
+        elif email_subject_flag:
+            email_subject_flag = False
+            current_email["subject"] = text
+        elif email_tags_flag:
+            email_tags_flag = False
+            current_email["type_tags"] = text.strip().split(", ")
+        # handles the quotes that continue in, or start at, this segment.
+        eid = int(ele.get("id")) + 1
+        still_open = []
+        for current_quote, new_entry, parts in open_quotes:
+            parts.append(segment_text(current_quote, eid, text))
+            if eid >= current_quote["eSegment"]:
+                new_entry["quote"] = "\n".join(parts)
+            else:
+                still_open.append((current_quote, new_entry, parts))
+        open_quotes = still_open
+        for current_quote in quote_index.starting_at(eid):
+            quote_tags = current_quote["tags"]
+            quote_id = current_quote["id"]
+            # updates current email
+            current_email["rationale_tags"].update(quote_tags)
+            # exports quotation.
+            new_entry = {
+                "quote_id": quote_id,
+                "quote": segment_text(current_quote, eid, text),
+                "tags": quote_tags,
+                "email_id": current_email["id"],
+                "email_subject": current_email["subject"],
+                "comment": "",
+                "email_tags": deepcopy(current_email["type_tags"]),
+            }
+
+            # load respective comment
+            comment_id = current_quote["comment_content_id"]
+            if comment_id is not None:
+                new_entry["comment"] = comments.load(comment_id)
 
-                # load respective comment
-                comment_id = current_quote["comment_content_id"]
-                if comment_id is not None:
-                    new_entry["comment"] = load_comment(cnt_to_doc, comment_id)
-
-                # Adds it to the list
-                tags_per_quote[doc_id].append(new_entry)
-                quote_index += 1
-                if quote_index < len(quotes):
-                    current_quote = quotes[quote_index]
-                else:
-                    break
-        # make sure the final one gets in too.
-        if current_email["id"] is not None:
-            tags_per_email[doc_id].append(deepcopy(current_email))
+            # Adds it to the list
+            tags_per_quote.append(new_entry)
+            if current_quote["eSegment"] > eid:
+                open_quotes.append((current_quote, new_entry, [new_entry["quote"]]))
+    # quotes running past the last segment keep the text that was found.
+    for _, new_entry, parts in open_quotes:
+        new_entry["quote"] = "\n".join(parts)
+    # make sure the final one gets in too.
+    if current_email["id"] is not None:
+        tags_per_email.append(deepcopy(current_email))
     return tags_per_email, tags_per_quote
 
 
-def load_comment(cnt_to_doc: dict, comment_content_id: str) -> str:
-    """Loads the text stored in te atlasti comment."""
-    comment_loc = cnt_to_doc[comment_content_id]
-    # print(f"{comment_loc=}")
-    comment_file = f"{ATLAS_PATH_OUT}contents/{comment_loc}/content"
-    with open(comment_file, "r", encoding="utf-8") as comment_data:
-        old_data = comment_data.read()
-        new_data = ""
-        prev_span_end = 0
-        for f in re.finditer(r"<br id=\".\">", old_data):
-            span = f.span()
-            delta = span[1] - span[0]
-            new_data = f'{new_data}{old_data[prev_span_end:span[0]]}{" " * delta}'
-            prev_span_end = span[1]
-        new_data = f"{new_data}{old_data[prev_span_end:]}"
-    with open(comment_file, "w", encoding="utf-8") as output_file:
-        output_file.write(new_data)
-    comment_root = ET.parse(comment_file).getroot()
-    comment_text = ""
-    for line in comment_root.find("body").find("p").findall("span"):
-        comment_text = f"{comment_text}\n{line.text}"
-    return comment_text
-
-
-def export_tpe(entries: dict, output_path: str, type_tags: list, rat_tags: list):
-    """exports the email .csv"""
+TASKS_PER_WORKER = 4
+
+_WORKER_STATE = {}
+
+
+def _init_worker(cnt_to_doc: dict, contents):
+    """Keeps the content index and accessor once per worker process."""
+    # forked workers must not share the archive handle of the parent.
+    contents.close()
+    _WORKER_STATE["cnt_to_doc"] = cnt_to_doc
+    _WORKER_STATE["contents"] = contents
+    _WORKER_STATE["comments"] = CommentLoader(cnt_to_doc, contents)
+
+
+def _generate_document(doc_id: str, quotes: list) -> tuple:
+    """Generates the entries of one document in a worker process."""
+    return generate_document(
+        doc_id,
+        quotes,
+        _WORKER_STATE["cnt_to_doc"],
+        _WORKER_STATE["contents"],
+        _WORKER_STATE["comments"],
+    )
+
+
+@timed(items=lambda data, *_, **__: len(data[0]))
+def generate_data(
+    cnt_to_doc: dict, quotes: dict, contents, workers: int = 1
+) -> tuple:
+    """
+    Generates data to export acquired from the atlas project.
+    With more than one worker the documents are generated in a process pool;
+    the results are merged in document order, so the exports don't change.
+    """
+    if workers > 1:
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(cnt_to_doc, contents)
+        ) as pool:
+            chunk_size = max(1, len(quotes) // (workers * TASKS_PER_WORKER))
+            results = list(
+                pool.map(
+                    _generate_document,
+                    quotes.keys(),
+                    quotes.values(),
+                    chunksize=chunk_size,
+                )
+            )
+    else:
+        comments = CommentLoader(cnt_to_doc, contents)
+        results = [
+            generate_document(doc_id, doc_quotes, cnt_to_doc, contents, comments)
+            for doc_id, doc_quotes in quotes.items()
+        ]
+    tags_per_email: dict[str, list] = {}
+    tags_per_quote = {}
+    for doc_id, (emails, doc_quotes) in zip(quotes.keys(), results):
+        tags_per_email[doc_id] = emails
+        tags_per_quote[doc_id] = doc_quotes
+    return tags_per_email, tags_per_quote
+
+
+@timed(items=lambda data, *_, **__: len(data[0]))
+def generate_data_cached(
+    cnt_to_doc: dict, quotes: dict, contents, cache_path: str, workers: int = 1
+) -> tuple:
+    """
+    Generates data like ``generate_data``, but only for the documents that
+    changed since the entries in the document cache were generated.
+    """
+    cache = DocumentCache(cache_path)
+    keys = {
+        doc_id: document_key(doc_id, doc_quotes, cnt_to_doc, contents)
+        for doc_id, doc_quotes in quotes.items()
+    }
+    stale = {
+        doc_id: doc_quotes
+        for doc_id, doc_quotes in quotes.items()
+        if cache.get(doc_id, keys[doc_id]) is None
+    }
+    print(f"regenerating {len(stale)} of {len(quotes)} documents")
+    tpe, tpq = generate_data(cnt_to_doc, stale, contents, workers)
+    for doc_id in stale:
+        cache.put(doc_id, keys[doc_id], tpe[doc_id], tpq[doc_id])
+    cache.save(quotes.keys())
+    tags_per_email: dict[str, list] = {}
+    tags_per_quote = {}
+    for doc_id in quotes.keys():
+        tags_per_email[doc_id], tags_per_quote[doc_id] = cache.get(doc_id, keys[doc_id])
+    return tags_per_email, tags_per_quote
+
+
+@timed(items=lambda _, entries, *__: sum(map(len, entries.values())))
+def export_tpe(
+    entries: dict,
+    output_path: str,
+    type_tags: list,
+    rat_tags: list,
+    matrix_path: str = None,
+):
+    """
+    exports the email .csv
+    With a ``matrix_path``, the tag columns are also written as a binary tag matrix.
+    """
     with open(output_path, "w+", encoding="utf-8") as output_file:
         # header
         output_file.write("document,email_id,email_subject,")
@@ -207,8 +430,8 @@ def export_tpe(entries: dict, output_path: str, type_tags: list, rat_tags: list)
             output_file.write(f'"{tag}",')
         output_file.write("\n")
         # data entries
-        for doc_id, entries in entries.items():
-            for entry in entries:
+        for doc_id, doc_entries in entries.items():
+            for entry in doc_entries:
                 # email meta data
                 email_id = entry["id"]
                 email_subject = entry["subject"].replace('"', "'")
@@ -220,10 +443,36 @@ def export_tpe(entries: dict, output_path: str, type_tags: list, rat_tags: list)
                 for tag in rat_tags:
                     output_file.write("1," if tag in entry["rationale_tags"] else "0,")
                 output_file.write("\n")
+    if matrix_path is not None:
+        rows = list(itertools.chain.from_iterable(entries.values()))
+        matrix = np.hstack(
+            [
+                build_tag_matrix([entry["type_tags"] for entry in rows], type_tags),
+                build_tag_matrix([entry["rationale_tags"] for entry in rows], rat_tags),
+            ]
+        )
+        write_tag_matrix(
+            matrix_path,
+            matrix,
+            type_tags + rat_tags,
+            ["document", "email_id"],
+            [(doc_id, entry["id"]) for doc_id in entries for entry in entries[doc_id]],
+            3,
+        )
 
 
-def export_tpq(entries: dict, output_path: str, rat_tags: list, dec_tags: list):
-    """exports the quote .csv"""
+@timed(items=lambda _, entries, *__: sum(map(len, entries.values())))
+def export_tpq(
+    entries: dict,
+    output_path: str,
+    rat_tags: list,
+    dec_tags: list,
+    matrix_path: str = None,
+):
+    """
+    exports the quote .csv
+    With a ``matrix_path``, the tag columns are also written as a binary tag matrix.
+    """
     with open(output_path, "w+", encoding="utf-8") as output_file:
         # header
         output_file.write("document,email_id,email_subject,quote_id,quote,comment,")
@@ -232,8 +481,8 @@ def export_tpq(entries: dict, output_path: str, rat_tags: list, dec_tags: list):
         output_file.write("\n")
         # entries
 
-        for doc_id, entries in entries.items():
-            for entry in entries:
+        for doc_id, doc_entries in entries.items():
+            for entry in doc_entries:
                 email_id = entry["email_id"]
                 email_subject = entry["email_subject"]
                 quote_id = entry["quote_id"]
@@ -242,13 +491,37 @@ def export_tpq(entries: dict, output_path: str, rat_tags: list, dec_tags: list):
                 output_file.write(
                     f'{doc_id},{email_id},"{email_subject}",{quote_id},"{quote}","{comment}",'
                 )
+                # quotes before the tags of their email have no decision types.
+                email_tags = entry["email_tags"] or ()
                 # rationale
                 for tag in dec_tags:
-                    output_file.write("1," if tag in entry["email_tags"] else "0,")
+                    output_file.write("1," if tag in email_tags else "0,")
                 # decision
                 for tag in rat_tags:
                     output_file.write("1," if tag in entry["tags"] else "0,")
                 output_file.write("\n")
+    if matrix_path is not None:
+        rows = list(itertools.chain.from_iterable(entries.values()))
+        matrix = np.hstack(
+            [
+                build_tag_matrix(
+                    [entry["email_tags"] or () for entry in rows], dec_tags
+                ),
+                build_tag_matrix([entry["tags"] for entry in rows], rat_tags),
+            ]
+        )
+        write_tag_matrix(
+            matrix_path,
+            matrix,
+            dec_tags + rat_tags,
+            ["document", "email_id", "quote_id"],
+            [
+                (doc_id, entry["email_id"], entry["quote_id"])
+                for doc_id in entries
+                for entry in entries[doc_id]
+            ],
+            6,
+        )
 
 
 def parse(
@@ -258,19 +531,45 @@ def parse(
     output_path2: str,
     dec_types: list,
     rat_types: list,
+    extract: bool = False,
+    workers: int = 1,
+    cache_path: str = None,
+    binary: bool = False,
 ):
-    """Parses the atlas project to the two datafiles."""
-    a_root = load_atlas_as_tree(atlas_path_in, atlas_path_out)
-    a_quotes: dict = load_all_quotes(a_root)
-    tpe, tpq = generate_data(a_root, a_quotes)
-    export_tpe(tpe, output_path1, dec_types, rat_types)
-    export_tpq(tpq, output_path2, rat_types, dec_types)
+    """
+    Parses the atlas project to the two datafiles.
+    The project is read straight from its zip; ``extract`` unpacks it to
+    ``atlas_path_out`` first and reads from there, which helps debugging.
+    ``workers`` sets the number of processes documents are generated with.
+    With a ``cache_path``, only documents that changed since the last run
+    are generated again. With ``binary``, the tag columns of both datafiles
+    are also written as binary tag matrices (``.npy``) next to them.
+    """
+    contents = open_atlas_contents(atlas_path_in, atlas_path_out, extract)
+    try:
+        a_index = load_atlas_index(contents)
+        if cache_path is None:
+            tpe, tpq = generate_data(
+                a_index["contents"], a_index["quotes"], contents, workers
+            )
+        else:
+            tpe, tpq = generate_data_cached(
+                a_index["contents"], a_index["quotes"], contents, cache_path, workers
+            )
+    finally:
+        contents.close()
+    matrix_path1 = matrix_path_for(output_path1) if binary else None
+    matrix_path2 = matrix_path_for(output_path2) if binary else None
+    export_tpe(tpe, output_path1, dec_types, rat_types, matrix_path1)
+    export_tpq(tpq, output_path2, rat_types, dec_types, matrix_path2)
 
 
+WORKERS = os.cpu_count()
 ATLAS_PATH_IN = "./data/the_best_exported_data/ds.atlproj"
 ATLAS_PATH_OUT = "./data/the_best_exported_data/extract/"
 OUTPUT_PATH = "./data/the_best_exported_data/export_emails.csv"
 OUTPUT_PATH2 = "./data/the_best_exported_data/export_quotes.csv"
+CACHE_PATH = "./data/the_best_exported_data/document_cache.json"
 DEC_TYPES = [
     "existence-behavioral",
     "existence-structural",
@@ -293,5 +592,13 @@ RAT_TYPES = [
 
 if __name__ == "__main__":
     parse(
-        ATLAS_PATH_IN, ATLAS_PATH_OUT, OUTPUT_PATH, OUTPUT_PATH2, DEC_TYPES, RAT_TYPES
+        ATLAS_PATH_IN,
+        ATLAS_PATH_OUT,
+        OUTPUT_PATH,
+        OUTPUT_PATH2,
+        DEC_TYPES,
+        RAT_TYPES,
+        workers=WORKERS,
+        cache_path=CACHE_PATH,
+        binary=True,
     )
@@ -1,48 +1,101 @@
+"""
+Counts the unique emails, threads and issues in the findings of
+``better_find_issues_in_text.py``, for any number of tag filters in one pass.
+"""
+
 import json
-from posixpath import split
 
-from numpy import true_divide
+from stage_metrics import timed
 
 
-def contains_any(listA: list, listB: list) -> bool:
-    for ele in listB:
-        if ele in listA:
-            return True
-    return False
+def normalize_subject(subject: str) -> str:
+    """Strips the reply prefix of a subject, so replies share their thread."""
+    # it's a reply
+    if subject.lower().startswith("re: ") or subject.lower()[2] == ":":
+        subject = subject[4:]
+    return subject
 
 
-def handle(data: dict, tags: list, t_map: dict):
-    unique_emails = set()
-    unique_threads = set()
-    unique_issues = {}
+def normalize_issue_key(issue_id: str, t_map: dict) -> str:
+    """Maps an issue variant (``Y123``, ``MR-123``, ...) to its full issue key."""
+    issue_split = issue_id.split("-")
+    if len(issue_split) == 1:
+        t = issue_split[0]
+        if t.startswith("Y"):
+            return f"YARN-{t[1:]}"
+        return f"HADOOP-{t[1:]}"
+    proj_key = t_map[issue_split[0]]
+    return f"{proj_key}-{issue_split[-1]}"
+
+
+def issue_key_table(issue_ids, t_map: dict) -> dict:
+    """Precomputes the full issue key of every variant with a known project."""
+    table = {}
+    for issue_id in issue_ids:
+        try:
+            table[issue_id] = normalize_issue_key(issue_id, t_map)
+        except KeyError:
+            continue
+    return table
+
+
+@timed(items=lambda _, data, *__: sum(map(len, data.values())))
+def handle_many(data: dict, tag_filters: dict, t_map: dict) -> dict:
+    """
+    Counts the references that carry any tag of a filter, for all named filters
+    in a single pass over the data. Tags are encoded as bits, so a filter test
+    is a single mask operation.
+    Returns ``{name: (unique emails, unique threads, unique issues)}``.
+    """
+    tag_bits = {}
+    for tags in tag_filters.values():
+        for tag in tags:
+            tag_bits.setdefault(tag, 1 << len(tag_bits))
+    filter_masks = {
+        name: sum(tag_bits[tag] for tag in set(tags))
+        for name, tags in tag_filters.items()
+    }
+    ref_masks = {}
+    key_table = issue_key_table(data, t_map)
+    results = {name: (set(), set(), {}) for name in tag_filters}
     for issue_id, issue in data.items():
         for ref in issue:
-            if not contains_any(ref["tags"], tags):
+            ref_tags = tuple(ref["tags"])
+            if ref_tags not in ref_masks:
+                ref_masks[ref_tags] = sum(
+                    tag_bits[tag] for tag in set(ref_tags) if tag in tag_bits
+                )
+            ref_mask = ref_masks[ref_tags]
+            if ref_mask == 0:
                 continue
+            subject = None
+            for name, filter_mask in filter_masks.items():
+                if ref_mask & filter_mask == 0:
+                    continue
+                if subject is None:
+                    subject = normalize_subject(ref["subject"])
+                    # Figuring out what issues are referenced
+                    r_issue_id = (
+                        key_table[issue_id]
+                        if issue_id in key_table
+                        else normalize_issue_key(issue_id, t_map)
+                    )
+                unique_emails, unique_threads, unique_issues = results[name]
+                unique_emails.add(ref["email_id"])
+                unique_threads.add(subject)
+                if r_issue_id not in unique_issues:
+                    unique_issues[r_issue_id] = set()
+                unique_issues[r_issue_id].add(issue_id)
+    for name, (unique_emails, unique_threads, unique_issues) in results.items():
+        for k, v in unique_issues.items():
+            unique_issues[k] = list(v)
+        results[name] = (list(unique_emails), list(unique_threads), unique_issues)
+    return results
+
 
-            unique_emails.add(ref["email_id"])
-            subject = ref["subject"]
-            # it's a reply
-            if subject.lower().startswith("re: ") or subject.lower()[2] == ":":
-                subject = subject[4:]
-            unique_threads.add(subject)
-            # Figuring out what issues are referenced
-            issue_split = issue_id.split("-")
-            if len(issue_split) == 1:
-                t = issue_split[0]
-                if t.startswith("Y"):
-                    r_issue_id = f"YARN-{t[1:]}"
-                else:
-                    r_issue_id = f"HADOOP-{t[1:]}"
-            else:
-                proj_key = t_map[issue_split[0]]
-                r_issue_id = f"{proj_key}-{issue_split[-1]}"
-            if r_issue_id not in unique_issues:
-                unique_issues[r_issue_id] = set()
-            unique_issues[r_issue_id].add(issue_id)
-    for k, v in unique_issues.items():
-        unique_issues[k] = list(v)
-    return list(unique_emails), list(unique_threads), unique_issues
+def handle(data: dict, tags: list, t_map: dict):
+    """Counts the unique emails, threads and issues of references with any of the tags."""
+    return handle_many(data, {"": tags}, t_map)[""]
 
 
 INPUT_FILE = "./data/the_best_exported_data/findings.json"
@@ -73,21 +126,22 @@ tag_maps = {
 }
 
 
-with open(INPUT_FILE, "r", encoding="utf-8") as input_file:
-    data = json.loads(input_file.read())
-    ue, ut, ui = handle(data, INTERESTING_TAGS, tag_maps)
-    print(json.dumps(ue, indent=4))
-    print(json.dumps(ut, indent=4))
-    print(json.dumps(ui, indent=4))
-    print(
-        f"Excluding Irrelevant:\nUnique Emails: {len(ue)}, Unique Threads {len(ut)}, Unique Issues: {len(ui)}"
-    )
-    print("\n\n\n\n\n\n\n\n\n\n\n\n\n")
-    INTERESTING_TAGS.append("Architecturally Irrelevant")
-    ue, ut, ui = handle(data, INTERESTING_TAGS, tag_maps)
-    print(json.dumps(ue, indent=4))
-    print(json.dumps(ut, indent=4))
-    print(json.dumps(ui, indent=4))
-    print(
-        f"Including Irrelevant:\nUnique Emails: {len(ue)}, Unique Threads {len(ut)}, Unique Issues: {len(ui)}"
+if __name__ == "__main__":
+    with open(INPUT_FILE, "r", encoding="utf-8") as input_file:
+        data = json.loads(input_file.read())
+    filter_results = handle_many(
+        data,
+        {
+            "Excluding Irrelevant": INTERESTING_TAGS,
+            "Including Irrelevant": INTERESTING_TAGS + ["Architecturally Irrelevant"],
+        },
+        tag_maps,
     )
+    for filter_name, (ue, ut, ui) in filter_results.items():
+        print(json.dumps(ue, indent=4))
+        print(json.dumps(ut, indent=4))
+        print(json.dumps(ui, indent=4))
+        print(
+            f"{filter_name}:\nUnique Emails: {len(ue)}, Unique Threads {len(ut)}, Unique Issues: {len(ui)}"
+        )
+        print("\n\n\n\n\n\n\n\n\n\n\n\n\n")
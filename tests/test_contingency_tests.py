@@ -0,0 +1,84 @@
+"""
+Checks the batched Fisher engine against ``scipy.stats.fisher_exact``.
+Run from the repository root with ``python -m pytest tests``.
+"""
+
+import os
+import sys
+
+import numpy as np
+from scipy.stats import fisher_exact
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_PATH)
+
+import contingency_tests
+from contingency_tests import FisherEngine
+
+ALTERNATIVES = ("less", "greater", "two-sided")
+# empty rows and columns, ties with the mode and symmetric tables.
+EDGE_TABLES = [
+    [0, 0, 0, 0],
+    [1, 0, 0, 0],
+    [0, 0, 1, 1],
+    [3, 0, 0, 3],
+    [0, 5, 5, 0],
+    [2, 2, 2, 2],
+    [10, 10, 10, 10],
+    [1, 2, 2, 1],
+]
+
+
+def random_tables(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    tables = [
+        rng.multinomial(size, rng.dirichlet([1.0] * 4))
+        for size in (5, 20, 60, 300, 3000)
+        for _ in range(100)
+    ]
+    return np.array(tables + EDGE_TABLES).reshape(-1, 2, 2)
+
+
+def scipy_p_values(tables: np.ndarray) -> np.ndarray:
+    return np.array(
+        [
+            [fisher_exact(table, alternative=side)[1] for side in ALTERNATIVES]
+            for table in tables
+        ]
+    )
+
+
+def test_batch_matches_fisher_exact():
+    tables = random_tables()
+    expected = scipy_p_values(tables)
+    np.testing.assert_allclose(
+        FisherEngine().test_batch(tables), expected, rtol=0, atol=1e-12
+    )
+    transposed = tables.transpose(0, 2, 1)
+    np.testing.assert_allclose(
+        FisherEngine().test_batch(transposed),
+        scipy_p_values(transposed),
+        rtol=0,
+        atol=1e-12,
+    )
+
+
+def test_batch_matches_fisher_exact_in_small_chunks(monkeypatch):
+    monkeypatch.setattr(contingency_tests, "FISHER_CHUNK_CELLS", 64)
+    tables = random_tables(seed=1)
+    np.testing.assert_allclose(
+        FisherEngine().test_batch(tables), scipy_p_values(tables), rtol=0, atol=1e-12
+    )
+
+
+def test_transposed_tables_share_a_memo_entry():
+    engine = FisherEngine()
+    table = np.array([[7, 1], [4, 9]])
+    assert engine.test(table) == engine.test(table.T)
+    assert len(engine) == 1
+
+
+def test_memo_is_bounded():
+    engine = FisherEngine(cache_size=10)
+    engine.test_batch(random_tables())
+    assert len(engine) == 10
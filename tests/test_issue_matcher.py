@@ -0,0 +1,126 @@
+"""
+Checks the single-pass issue matcher and the sharded parallel scan against the
+naive scan the finder started out with: one ``str.find`` and one regex per issue
+and line. Run from the repository root with ``python -m pytest tests``.
+"""
+
+import os
+import re
+import sys
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_PATH)
+
+from better_find_issues_in_text import find_issues_in, find_issues_parallel
+from issue_matcher import IssueMatcher
+
+# prefixes of each other, short variants and a repeated issue.
+ISSUES = [
+    "HDFS-1",
+    "HDFS-12",
+    "HDFS-123",
+    "HADOOP-7",
+    "H7",
+    "H-7",
+    "YARN-45",
+    "Y45",
+    "MR-9",
+    "HDFS-12",
+]
+BODY_LINES = [
+    "See HDFS-123 and HDFS-12, also HDFS-1.",
+    "HDFS-1234 is not HDFS-123 nor HDFS-12",
+    "> quoted reply about YARN-45: still broken",
+    ">> > Y45, H7 and H-7 come from the same HADOOP-7 fix",
+    "trailing reference without a separator HADOOP-7",
+    "MR-99 and MR-9x and MR-9 MR-9 twice",
+    "nothing to see here",
+    "HDFS-12HDFS-1 HDFS-1HDFS-12 glued together",
+]
+
+
+def write_export(path: str, messages: int = 30):
+    """Writes a small data browser export whose messages differ in meta data."""
+    with open(path, "w", encoding="utf-8") as export_file:
+        for message in range(messages):
+            lines = [f"Message id: {message}", f"Subject: Thread {message % 4}"]
+            if message % 3 != 0:
+                lines.append(f"Date: 2015-01-{1 + message % 28:02d} 10:00:00")
+            if message % 5 != 0:
+                lines.append(f"Email id: <{message}@example.org>")
+            if message % 2 == 0:
+                lines.append("Tags: Issue Impact, Design")
+            lines.extend(
+                BODY_LINES[(message + shift) % len(BODY_LINES)] for shift in range(3)
+            )
+            export_file.write("\n".join(lines) + "\n\n")
+
+
+def naive_find_issues_in(iss: list, file_path: str) -> dict:
+    """The original per-issue scan of the finder, keyed by issue."""
+    results = {}
+    with open(file_path, "r", encoding="utf-8") as data_file:
+        current_message = {}
+        for index, line in enumerate(data_file):
+            the_line = line.strip()
+            if the_line.startswith("Message id: "):
+                current_message["id"] = the_line[len("Message id: ") :].strip()
+            elif the_line.startswith("Subject: "):
+                current_message["subject"] = the_line[len("Subject: ") :].strip()
+            elif the_line.startswith("Date: "):
+                current_message["date"] = the_line[len("Date: ") :].strip()
+            elif the_line.startswith("Email id: "):
+                current_message["email_id"] = the_line[len("Email id: ") :].strip()
+            elif the_line.startswith("Tags:"):
+                current_message["tags"] = [
+                    tag.strip() for tag in the_line[len("Tags:") :].split(",")
+                ]
+            else:
+                for issue in iss:
+                    offset = the_line.find(issue)
+                    if offset == -1:
+                        continue
+                    re_finds = re.findall(rf"{issue}[^0-9]", the_line)
+                    if len(re_finds) == 0:
+                        continue
+                    new_entry = dict(current_message)
+                    new_entry["line_index"] = index
+                    new_entry["line"] = the_line
+                    new_entry["offset"] = offset
+                    new_entry["re_finds"] = re_finds
+                    results.setdefault(issue, []).append(new_entry)
+    return results
+
+
+def test_matcher_matches_naive_scan_per_line():
+    matcher = IssueMatcher(ISSUES)
+    for line in BODY_LINES:
+        expected = [
+            issue for issue in ISSUES if len(re.findall(rf"{issue}[^0-9]", line)) > 0
+        ]
+        # repeated issues are reported together, at their first place in the vocabulary.
+        assert matcher.match(line) == sorted(expected, key=ISSUES.index)
+
+
+def test_sequential_scan_matches_naive_scan(tmp_path):
+    export_path = str(tmp_path / "export.txt")
+    write_export(export_path)
+    expected = naive_find_issues_in(ISSUES, export_path)
+    table, count = find_issues_in(ISSUES, export_path)
+    findings = table.to_issue_view()
+    assert list(findings) == list(expected)
+    assert findings == expected
+    assert count == sum(map(len, expected.values()))
+
+
+def test_parallel_scan_matches_naive_scan(tmp_path):
+    export_paths = [str(tmp_path / "export.txt"), str(tmp_path / "other.txt")]
+    write_export(export_paths[0])
+    write_export(export_paths[1], messages=7)
+    file_findings = find_issues_parallel(ISSUES, export_paths, workers=2)
+    for export_path, (table, count) in zip(export_paths, file_findings):
+        expected = naive_find_issues_in(ISSUES, export_path)
+        findings = table.to_issue_view()
+        assert list(findings) == list(expected)
+        assert findings == expected
+        assert count == sum(map(len, expected.values()))